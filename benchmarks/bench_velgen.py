@@ -0,0 +1,207 @@
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from velgen.model import Model
+from velgen.layer import FlatLayer, DippingLayer, LinearWaterLayer
+from velgen.fold import CosineFold
+from velgen.fault import LinearFault
+from velgen.salt import GaussianSalt, EllipticSalt
+from velgen import util
+
+SHAPES = [(128,100), (500,250), (1000,500), (2000,1000), (4000,1000)]
+QUICK_SHAPES = [(128,100), (500,250)]
+NLAYERS = [5, 10, 25, 50]
+QUICK_NLAYERS = [5, 25]
+
+
+def velseed(nlayers):
+    return np.linspace(1.5, 4.5, nlayers)
+
+
+def layered_model(shape, nlayers, seed, fill=True):
+    model = Model(shape, velseed(nlayers), random_seed=seed)
+    FlatLayer(minsplit=0.01, random_seed=seed).generate(model)
+    if fill:
+        model.generate()
+    return model
+
+
+def step_case(step_class, needs_interface=True, fill=True, flush=False, **kwargs):
+    def setup(shape, nlayers, seed):
+        if needs_interface:
+            model = layered_model(shape, nlayers, seed, fill)
+        else:
+            model = Model(shape, velseed(nlayers), random_seed=seed)
+        step = step_class(random_seed=seed, **kwargs)
+        if flush:
+            # the step defers its work (faults warp at the next flush), time it too
+            return lambda: (step.generate(model), model.flush())
+        return lambda: step.generate(model)
+    return setup
+
+
+def fill_case(shape, nlayers, seed):
+    model = layered_model(shape, nlayers, seed, fill=False)
+    CosineFold(random_seed=seed).generate(model)
+    vel = model.random.perturb(model.velseed, model.max_pert, fix_top=True)
+    return lambda: model.fill_velocity(vel)
+
+
+def factory_case(factory, **kwargs):
+    def setup(shape, nlayers, seed):
+        pipe = factory(shape, velseed(nlayers), random_seed=seed, **kwargs)
+        return pipe.generate
+    return setup
+
+
+def gom_case(shape, nlayers, seed):
+    return lambda: util.gom_generator(shape, 0.01, nlayers=nlayers, generate=True, random_seed=seed)
+
+
+CASES = {
+    'step.FlatLayer': step_case(FlatLayer, needs_interface=False, minsplit=0.01),
+    'step.DippingLayer': step_case(DippingLayer, needs_interface=False, minsplit=0.01),
+    'step.CosineFold': step_case(CosineFold, fill=False),
+    'step.LinearFault': step_case(LinearFault, flush=True, nfaults=3),
+    'step.GaussianSalt': step_case(GaussianSalt, flush=True),
+    'step.EllipticSalt': step_case(EllipticSalt, flush=True),
+    'step.LinearWaterLayer': step_case(LinearWaterLayer),
+    'Model.fill_velocity': fill_case,
+    'util.flat_generator': factory_case(util.flat_generator),
+    'util.dip_generator': factory_case(util.dip_generator),
+    'util.cosine_fold_generator': factory_case(util.cosine_fold_generator),
+    'util.linear_fault_generator': factory_case(util.linear_fault_generator),
+    'util.gaussian_salt_generator': factory_case(util.gaussian_salt_generator),
+    'util.elliptic_salt_generator': factory_case(util.elliptic_salt_generator),
+    'util.gaussian_elliptic_salt_generator': factory_case(util.gaussian_elliptic_salt_generator),
+    'util.gom_generator': gom_case,
+}
+
+
+def measure(setup, shape, nlayers, repeat, min_time):
+    # time: best median over fresh setups; memory: one traced run so tracing does not skew timing
+    times = []
+    seed = 0
+    while len(times) < repeat or sum(times) < min_time:
+        run = setup(shape, nlayers, seed)
+        t0 = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - t0)
+        seed += 1
+        if len(times) >= 100*repeat:
+            break
+    run = setup(shape, nlayers, seed)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    t = float(np.median(times))
+    ncells = shape[0]*shape[1]
+    return {
+        'time': t,
+        'nruns': len(times),
+        'models_per_s': 1/t,
+        'mcells_per_s': ncells/t/1e6,
+        'peak_mb': peak/2**20,
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def run(names, shapes, nlayers_list, repeat, min_time, verbose=True):
+    results = []
+    if verbose:
+        print('%-40s %12s %4s %10s %10s %10s %9s'%('case','shape','nl','ms','models/s','Mcells/s','peak MB'))
+    for name in names:
+        for shape in shapes:
+            for nlayers in nlayers_list:
+                try:
+                    r = measure(CASES[name], shape, nlayers, repeat, min_time)
+                except SystemExit:
+                    # e.g. too many layers for the factory's minsplit
+                    if verbose:
+                        print('%-40s %12s %4d   skipped'%(name, '%dx%d'%shape, nlayers))
+                    continue
+                r.update(name=name, shape=list(shape), nlayers=nlayers)
+                results.append(r)
+                if verbose:
+                    print('%-40s %12s %4d %10.3f %10.2f %10.2f %9.2f'%(name, '%dx%d'%shape, nlayers,
+                        r['time']*1e3, r['models_per_s'], r['mcells_per_s'], r['peak_mb']))
+    return results
+
+
+def key(r):
+    return (r['name'], tuple(r['shape']), r['nlayers'])
+
+
+def compare(old, new, threshold):
+    # ratio > 1 means slower than the baseline
+    base = {key(r): r for r in old['results']}
+    regressions = []
+    print('%-40s %12s %4s %10s %10s %8s'%('case','shape','nl','old ms','new ms','ratio'))
+    for r in new['results']:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        ratio = r['time']/b['time']
+        flag = ' <--' if ratio > 1+threshold else ''
+        if flag:
+            regressions.append(key(r))
+        print('%-40s %12s %4d %10.3f %10.3f %8.2f%s'%(r['name'], '%dx%d'%tuple(r['shape']), r['nlayers'],
+            b['time']*1e3, r['time']*1e3, ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark velgen steps, factories and the velocity fill')
+    parser.add_argument('-k', '--filter', default='', help='only run cases containing this string')
+    parser.add_argument('--quick', action='store_true', help='small grids and layer counts only')
+    parser.add_argument('--shapes', nargs='*', help='grid sizes as NXxNY, e.g. 1000x500')
+    parser.add_argument('--nlayers', nargs='*', type=int)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum total seconds per case')
+    parser.add_argument('-o', '--output', help='save results as json')
+    parser.add_argument('--compare', help='json results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown reported as a regression')
+    parser.add_argument('--list', action='store_true')
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if args.filter in name]
+    if args.list:
+        print('\n'.join(names))
+        return 0
+    if args.shapes:
+        shapes = [tuple(int(n) for n in s.lower().split('x')) for s in args.shapes]
+    else:
+        shapes = QUICK_SHAPES if args.quick else SHAPES
+    nlayers_list = args.nlayers or (QUICK_NLAYERS if args.quick else NLAYERS)
+
+    results = {'env': environment(), 'results': run(names, shapes, nlayers_list, args.repeat, args.min_time)}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
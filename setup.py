@@ -6,5 +6,7 @@ setuptools.setup(
         description='Random seismic velocity generator',
         author='Wansoo Ha',
         author_email='wansooha@gmail.com',
-        packages=setuptools.find_packages()
+        packages=setuptools.find_packages(),
+        extras_require={'jit': ['numba']},
+        entry_points={'console_scripts': ['velgen-generate=velgen.shards:main']}
 )
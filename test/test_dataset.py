@@ -0,0 +1,54 @@
+import os
+import multiprocessing as mp
+import numpy as np
+import pytest
+from functools import partial
+from velgen.dataset import generate_dataset
+from velgen.util import gom_generator
+
+
+def test_generate_dataset():
+    factory = partial(gom_generator, (128,100), 0.01)
+    vel1 = generate_dataset(factory, 8, workers=1, random_seed=7)
+    vel3 = generate_dataset(factory, 8, workers=3, random_seed=7, chunksize=2)
+    assert vel1.shape == (8,128,100) and vel1.dtype == np.float32
+    assert np.array_equal(vel1, vel3)
+    vel1.tofile('dataset8.bin')
+
+
+def test_stream():
+    from itertools import islice
+    from velgen.dataset import stream
+    factory = partial(gom_generator, (128,100), 0.01)
+    ref = generate_dataset(factory, 6, workers=1, random_seed=4)
+    for workers in (0, 2):
+        batches = stream(factory, 2, prefetch=2, workers=workers, random_seed=4)
+        vel = np.concatenate(list(islice(batches, 3)))
+        batches.close()
+        assert np.array_equal(vel, ref)
+
+
+def _dying_factory(random_seed):
+    # the parent draws sample 0 itself; workers exit hard on their first sample
+    if mp.parent_process() is not None:
+        os._exit(3)
+    return np.zeros((8,6), dtype=np.float32)
+
+
+def test_stream_dead_worker():
+    from velgen.dataset import stream
+    batches = stream(_dying_factory, 2, workers=1, random_seed=1)
+    with pytest.raises(RuntimeError, match="exited with code 3"):
+        next(batches)
+    batches.close()
+
+
+def test_seed_sequence():
+    # a SeedSequence passed in is not spawned from, so the same one gives the same samples
+    factory = partial(gom_generator, (64,50), 0.01)
+    root = np.random.SeedSequence(9)
+    vels = generate_dataset(factory, 3, workers=1, random_seed=root)
+    assert np.array_equal(generate_dataset(factory, 3, workers=1, random_seed=root), vels)
+    assert np.array_equal(generate_dataset(factory, 3, workers=1, random_seed=9), vels)
+    assert np.array_equal(factory(random_seed=root).generate(), factory(random_seed=root).generate())
+    assert root.n_children_spawned == 0
@@ -0,0 +1,37 @@
+import numpy as np
+from velgen.model import Model, Pipeline
+from velgen.layer import FlatLayer
+from velgen.dedup import DuplicateIndex, signature, unique
+
+
+def test_signature():
+    vel = np.random.default_rng(0).uniform(1.5,4.5,(3,50,30)).astype(np.float32)
+    sig = signature(vel, (5,3))
+    assert sig.shape == (3,15)
+    assert np.allclose(sig[1,4], vel[1,10:20,10:20].mean())
+    assert np.allclose(signature(vel[2], (5,3)), sig[2])
+
+
+def test_duplicates(tmp_path):
+    # two-layer models split near the middle are often within tol of each other
+    vels = np.stack([Pipeline([FlatLayer(y_range=(0.45,0.55), random_seed=s+100)]).generate(
+        Model((128,64), np.linspace(1.5,3,3), random_seed=s)) for s in range(100)])
+    sig = signature(vels)
+    dist = np.sqrt(((sig[:,None] - sig[None])**2).mean(-1))
+    tol = 0.01
+    index = DuplicateIndex(tol)
+    dup = index.add(vels, reject=False)
+    for i, j in enumerate(dup):
+        if j >= 0:
+            assert j < i and dist[i,j] <= tol
+    assert (dup >= 0).sum() >= 0.9 * sum((dist[i,:i] <= tol).any() for i in range(len(vels)))
+    assert (dup >= 0).any() and (dup < 0).any()
+
+    index = DuplicateIndex(tol)
+    kept = np.concatenate(list(unique(np.split(vels, 4), index)))
+    assert len(kept) == len(index) < len(vels)
+    assert np.all(index.query(kept) >= 0)
+
+    index.save(str(tmp_path / 'index.npz'))
+    loaded = DuplicateIndex.load(str(tmp_path / 'index.npz'))
+    assert np.array_equal(loaded.query(vels), index.query(vels))
@@ -0,0 +1,36 @@
+import numpy as np
+from velgen.kernels import kernel
+from velgen.deform import FaultField, warp
+
+
+def loop_add_fault(vel, it, ib, vshift, ny):
+    fault_line = np.linspace(it,ib,ny).astype(np.int32)
+    hshift = int(abs(it-ib)/ny*vshift)
+    vpad = abs(vshift)
+    hpad = abs(hshift)
+    velpad = np.pad(vel, [(hpad,hpad),(vpad,vpad)], mode='edge')
+    velnew = vel.copy()
+    for iy in range(ny):
+        for ix in range(fault_line[iy]):
+            velnew[ix,iy] = velpad[ix+hpad-hshift, iy+vpad-vshift]
+    return velnew
+
+
+def test_fault_parity():
+    rng = np.random.default_rng(2)
+    for t in range(100):
+        nx, ny = rng.integers(2,60,size=2)
+        it, ib = rng.integers(0,nx+1,size=2)
+        vshift = int(rng.integers(-ny-3,ny+4))
+        vel = rng.uniform(size=(nx,ny)).astype(np.float32)
+        ref = loop_add_fault(vel, it, ib, vshift, ny)
+        fault_line = np.linspace(it,ib,ny).astype(np.int32)
+        hshift = int(abs(it-ib)/ny*vshift)
+        assert np.array_equal(kernel('fault_shift')(vel.copy(), fault_line, hshift, vshift), ref)
+        # the displacement field, alone or resampling labels too
+        out = vel.copy()
+        warp(out, None, [FaultField(it, ib, vshift, ny)])
+        assert np.array_equal(out, ref)
+        out, labels = vel.copy(), np.zeros((nx,ny), dtype=np.uint8)
+        warp(out, labels, [FaultField(it, ib, vshift, ny)])
+        assert np.array_equal(out, ref)
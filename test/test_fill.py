@@ -0,0 +1,41 @@
+import numpy as np
+from velgen.model import Model
+from velgen.fill import fill_layers, const_velocity, vlinear_velocity
+
+
+def loop_fill(vel, interface, velseed):
+    ny = vel.shape[1]
+    for ix in range(vel.shape[0]):
+        for i in range(len(velseed)):
+            iy0 = interface[i,ix]
+            iy1 = interface[i+1,ix]
+            if velseed.ndim == 1:
+                vel[ix,iy0:iy1] = velseed[i]
+            else:
+                n = len(range(*slice(iy0,iy1).indices(ny)))
+                vel[ix,iy0:iy1] = np.linspace(velseed[i,0],velseed[i,1],n)
+    return vel
+
+
+def test_fill_parity():
+    rng = np.random.default_rng(1)
+    for t in range(100):
+        nx, ny = rng.integers(1,40,size=2)
+        nlayers = rng.integers(1,8)
+        interface = rng.integers(-5,ny+5,size=(nlayers+1,nx)).astype(np.int32)
+        if t % 2:
+            interface.sort(axis=0)
+        init = rng.uniform(size=(nx,ny)).astype(np.float32)
+        for velseed, func in [(rng.uniform(1,5,size=nlayers), const_velocity),
+                              (rng.uniform(1,5,size=(nlayers,2)), vlinear_velocity)]:
+            ref = loop_fill(init.copy(), interface, velseed)
+            vel = fill_layers(init.copy(), interface, velseed, func)
+            assert np.array_equal(ref, vel)
+
+
+def test_lateral():
+    model = Model((50,40), [(1.5,2.0),(2.5,3.0)], max_pert=0, veltype='lateral')
+    model.set_interface(np.array([[0]*50,[20]*50,[40]*50], dtype=np.int32))
+    vel = model.generate()
+    assert np.allclose(vel[0,:20], 1.5) and np.allclose(vel[-1,:20], 2.0)
+    assert np.allclose(vel[0,20:], 2.5) and np.allclose(vel[-1,20:], 3.0)
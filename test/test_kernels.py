@@ -0,0 +1,36 @@
+import pytest
+import numpy as np
+from velgen import kernels
+from velgen.model import Model
+from velgen.util import gom_generator, elliptic_salt_generator
+
+
+def generate_all(backend):
+    previous = kernels.use_backend(backend)
+    try:
+        out = []
+        for seed in range(6):
+            for pipe in (gom_generator((200,100), 0.01, random_seed=seed),
+                         elliptic_salt_generator((200,100), np.linspace(1.5,3.5,10), random_seed=seed)):
+                model = Model(pipe.model.shape, pipe.model.velseed, random_seed=seed, labels=True, masks=True)
+                out.append((pipe.generate(model).copy(), model.labels.copy(), model.masks.copy()))
+        return out
+    finally:
+        kernels.use_backend(previous)
+
+
+def test_backend_fallback():
+    previous = kernels.backend
+    assert kernels.use_backend('no-such-backend') == 'numpy'
+    kernels.use_backend(previous)
+
+
+def test_numba_parity():
+    previous = kernels.backend
+    available = kernels.use_backend('numba') == 'numba'
+    kernels.use_backend(previous)
+    if not available:
+        pytest.skip('numba is not installed')
+    for ref, out in zip(generate_all('numpy'), generate_all('numba')):
+        for a, b in zip(ref, out):
+            assert np.array_equal(a, b)
@@ -1,9 +1,12 @@
+import pytest
 import numpy as np
-from velgen.model import Pipeline, Model
+from velgen.model import Pipeline, Model, mask_bits
 from velgen.layer import FlatLayer, DippingLayer, LinearWaterLayer
 from velgen.fold import CosineFold
 from velgen.fault import LinearFault
 from velgen.salt import GaussianSalt, EllipticSalt
+from velgen.scene import Scene
+from velgen.workspace import Workspace
 
 def test_pipe():
 
@@ -173,3 +176,201 @@ def test_ellipse():
         ])
     vel = pipe.generate(model)
     vel.tofile('ellipse3.bin')
+
+    model = Model(shape, velseed)
+    pipe = Pipeline([
+        DippingLayer(y_range=(0.1,0.9),minsplit=0.01),
+        EllipticSalt(vsalt=5.0, angle_range=(-60,60), nbodies=3),
+        ])
+    vel = pipe.generate(model)
+    assert len(model.history['elliptic_angle']) == 3
+    assert (vel == 5.0).any()
+    vel.tofile('ellipse4.bin')
+
+    salt = EllipticSalt()
+    yy,xx = np.meshgrid(np.arange(100),np.arange(200))
+    dx, dy = xx-80.5, yy-40.2
+    t = np.deg2rad(30)
+    full = ((dx*np.cos(t)+dy*np.sin(t))/50)**2 + ((dy*np.cos(t)-dx*np.sin(t))/12)**2 <= 1
+    assert np.array_equal(salt.mask(200,100,80.5,40.2,50,12,30), full)
+
+def test_batch():
+    shape = (128,100)
+    velseed = np.linspace(1.5,3.5,10)
+
+    model = Model(shape, velseed)
+    pipe = Pipeline([
+        DippingLayer(y_range=(0.1,0.9),minsplit=0.01),
+        CosineFold(uniform=False),
+        LinearFault(nfaults=2),
+        GaussianSalt(width_range=(0.05,0.1), height_range=(0.4,0.6)),
+        LinearWaterLayer(y_range=(0.1,0.2))
+        ])
+    vel = pipe.generate_batch(4, model)
+    assert vel.shape == (4,)+shape and vel.dtype == np.float32
+    assert vel.flags.c_contiguous and vel.min() > 0
+    vel.tofile('batch4.bin')
+
+def test_deferred():
+    shape = (200,100)
+    velseed = np.linspace(1.5,3.5,20)
+
+    def steps():
+        return [
+            DippingLayer(y_range=(0.1,0.9),minsplit=0.01,random_seed=1),
+            LinearFault(nfaults=2,random_seed=2),
+            GaussianSalt(width_range=(0.05,0.1), height_range=(0.4,0.6),random_seed=3),
+            EllipticSalt(random_seed=4),
+            LinearWaterLayer(y_range=(0.1,0.2),random_seed=5)]
+
+    vel = Pipeline(steps()).generate(Model(shape, velseed, random_seed=0))
+    vel_deferred = Pipeline(steps(), deferred=True).generate(Model(shape, velseed, random_seed=0))
+    assert np.array_equal(vel, vel_deferred)
+    vel_deferred.tofile('deferred.bin')
+
+def test_profiler():
+    from velgen.instrument import StepProfiler
+    shape = (128,100)
+    velseed = np.linspace(1.5,3.5,10)
+    profiler = StepProfiler()
+    pipe = Pipeline([
+        FlatLayer(minsplit=0.01),
+        LinearFault(nfaults=2),
+        LinearWaterLayer()
+        ], hooks=[profiler])
+    for i in range(3):
+        pipe.generate(Model(shape, velseed))
+    profiler.stop()
+    records = profiler.to_records()
+    assert len(records) == 3*4
+    assert [r['step'] for r in records[:4]] == ['FlatLayer', 'LinearFault', 'LinearWaterLayer', 'generate']
+    assert records[0]['rng_count'] == 1 and records[-1]['sample'] == 2
+    assert 'LinearFault' in profiler.table()
+    # fork runs the prefix once through the same hooks, then each variant's suffix
+    profiler.clear()
+    pipe.fork(pipe.steps[:1], [pipe.steps[1:]], 2, model=Model(shape, velseed), random_seed=3)
+    profiler.stop()
+    records = profiler.to_records()
+    assert [r['step'] for r in records] == ['FlatLayer'] + ['LinearFault', 'LinearWaterLayer', 'generate'] * 2
+    assert [r['index'] for r in records] == [0, 1, 2, 3, 1, 2, 3]
+
+def test_compact():
+    shape = (200,100)
+    velseed = np.linspace(1.5,3.5,12)
+    for deferred in (False, True):
+        model = Model(shape, velseed, labels=True)
+        pipe = Pipeline([
+            DippingLayer(y_range=(0.1,0.9),minsplit=0.01),
+            CosineFold(),
+            LinearFault(nfaults=2),
+            GaussianSalt(width_range=(0.05,0.1), height_range=(0.4,0.6)),
+            EllipticSalt(),
+            LinearWaterLayer(y_range=(0.1,0.2))
+            ], deferred=deferred)
+        vel = pipe.generate(model)
+        compact = model.compact()
+        assert compact.labels.dtype == np.uint8
+        assert compact.nbytes < vel.nbytes/3
+        assert np.array_equal(compact.to_dense(), vel)
+        assert compact.names[-2:] == ['salt', 'water']
+        compact.labels.tofile('compact_labels.bin')
+    # sub-pixel faults interpolate velocities that no label stands for
+    model = Model(shape, velseed, random_seed=2, labels=True)
+    Pipeline([DippingLayer(random_seed=3), LinearFault(nfaults=2, subpixel=True, random_seed=4)]).generate(model)
+    with pytest.raises(SystemExit):
+        model.compact()
+
+def test_segmentation():
+    shape = (200,100)
+    velseed = np.linspace(1.5,3.5,12)
+    steps = lambda: [
+        DippingLayer(y_range=(0.1,0.9),minsplit=0.01, random_seed=1),
+        LinearFault(nfaults=2, random_seed=2),
+        EllipticSalt(random_seed=3),
+        LinearFault(nfaults=1, random_seed=4),
+        LinearWaterLayer(y_range=(0.1,0.2), random_seed=5)]
+    segs = []
+    for deferred in (False, True):
+        model = Model(shape, velseed, random_seed=6, labels=True, masks=True)
+        vel = Pipeline(steps(), deferred=deferred).generate(model)
+        seg = model.segmentation()
+        names = np.array(model.label_names())
+        assert np.array_equal(seg['salt'], names[seg['layer']] == 'salt')
+        assert np.array_equal(seg['water'], names[seg['layer']] == 'water')
+        assert seg['fault'].any() and not (seg['fault'] & seg['water']).any()
+        segs.append(model.masks.copy())
+    assert np.array_equal(segs[0], segs[1])
+    # the masks do not change the velocity
+    assert np.array_equal(vel, Pipeline(steps()).generate(Model(shape, velseed, random_seed=6)))
+    segs[0].tofile('segmentation_masks.bin')
+
+def test_scene():
+    shape = (200,100)
+    velseed = np.linspace(1.5,3.5,12)
+    model = Model(shape, velseed)
+    pipe = Pipeline([
+        DippingLayer(y_range=(0.1,0.9),minsplit=0.01),
+        CosineFold(uniform=False),
+        LinearFault(nfaults=2),
+        GaussianSalt(width_range=(0.05,0.1), height_range=(0.4,0.6)),
+        EllipticSalt(),
+        LinearWaterLayer(y_range=(0.1,0.2))
+        ])
+    vel = pipe.generate(model).copy()
+    scene = Scene(model)
+    assert np.array_equal(scene.rasterize(), vel)
+    assert np.array_equal(scene.rasterize(deferred=True), vel)
+    fine, coarse = scene.rasterize_many([(400,200), (100,50)])
+    assert fine.shape == (400,200) and coarse.shape == (100,50)
+    assert np.isclose(fine[::2,::2], vel, atol=0.05).mean() > 0.7
+    fine.tofile('scene_fine.bin')
+
+def test_fork():
+    shape = (200,100)
+    velseed = np.linspace(1.5,3.5,12)
+    model = Model(shape, velseed)
+    prefix = [FlatLayer(y_range=(0.1,0.9),minsplit=0.02), CosineFold()]
+    suffixes = [[LinearFault()], [GaussianSalt(width_range=(0.05,0.1), height_range=(0.4,0.6)), LinearWaterLayer()]]
+    vels = Pipeline([]).fork(prefix, suffixes, 3, model=model, random_seed=11)
+    assert len(vels) == 2 and len(vels[1]) == 3
+    assert not np.array_equal(vels[1][0], vels[1][1])
+    again = Pipeline([], deferred=True).fork(prefix, suffixes, 3, model=model, random_seed=11)
+    for row, row2 in zip(vels, again):
+        for vel, vel2 in zip(row, row2):
+            assert np.array_equal(vel, vel2)
+    # the cached prefix of a model without masks is not reused for one with masks
+    masked = Model(shape, velseed, masks=True)
+    again = Pipeline([]).fork(prefix, suffixes, 3, model=masked, random_seed=11)
+    assert np.array_equal(again[1][2], vels[1][2])
+    assert masked.masks is not None and (masked.masks & mask_bits['salt']).any()
+    np.array(vels).tofile('fork.bin')
+
+def test_fork_workspace():
+    # a cached prefix keeps its own velocity, not the workspace buffer other models reuse
+    shape = (160,80)
+    velseed = np.linspace(1.5,3.5,10)
+    ws = Workspace()
+    prefix = [FlatLayer(y_range=(0.1,0.9),minsplit=0.02), LinearFault(nfaults=2)]
+    suffixes = [[LinearWaterLayer()]]
+    first = Pipeline([]).fork(prefix, suffixes, 2, model=Model(shape, velseed, workspace=ws), random_seed=21)
+    other = Model(shape, velseed[::-1], random_seed=3, workspace=ws)
+    Pipeline([DippingLayer(random_seed=4), LinearFault(random_seed=5)]).generate(other)
+    again = Pipeline([]).fork(prefix, suffixes, 2, model=Model(shape, velseed, workspace=ws), random_seed=21)
+    assert np.array_equal(np.array(first), np.array(again))
+
+def test_fault_field():
+    shape = (150,90)
+    velseed = np.linspace(1.5,3.5,8)
+    for seed in range(5):
+        steps = lambda: [FlatLayer(random_seed=seed), CosineFold(random_seed=seed), LinearFault(nfaults=3, random_seed=seed+1)]
+        # faults resampled together (labels tracked) or one by one give the same model
+        model = Model(shape, velseed, random_seed=seed, labels=True)
+        vel = Pipeline(steps()).generate(model)
+        ref = Pipeline(steps()).generate(Model(shape, velseed, random_seed=seed))
+        assert np.array_equal(vel, ref)
+
+    steps = lambda: [FlatLayer(random_seed=1), LinearFault(nfaults=3, subpixel=True, random_seed=2), LinearWaterLayer(random_seed=3)]
+    vel = Pipeline(steps()).generate(Model(shape, velseed, random_seed=5)).copy()
+    deferred = Pipeline(steps(), deferred=True).generate(Model(shape, velseed, random_seed=5))
+    assert np.array_equal(vel, deferred)
+    vel.tofile('subpixel_fault.bin')
@@ -0,0 +1,75 @@
+import copy
+import numpy as np
+from velgen.plan import Plan, load_plan, gom_spec
+from velgen.dataset import generate_dataset
+from velgen.scene import Scene
+
+
+def test_plan():
+    plan = Plan(gom_spec, shape=(128,64))
+    vel = plan.generate(5)
+    assert vel.shape == (128,64)
+    assert np.array_equal(plan.generate(5), vel)
+    assert not np.array_equal(plan.generate(6), vel)
+    # the plan's buffer is reused between samples
+    assert plan.generate(7, copy=False) is plan.generate(8, copy=False)
+
+
+def test_plan_velocities():
+    # velocities in km/s; all salt bodies of a sample share one salt velocity
+    plan = Plan(gom_spec)
+    for seed in range(40):
+        vel = plan.generate(seed)
+        assert 1.3 < vel.min() and vel.max() < 5.1
+        vsalts = set(step.vsalt for step in plan.pipe.steps if hasattr(step, 'vsalt'))
+        assert len(vsalts) <= 1 and all(4.5 <= v <= 5.0 for v in vsalts)
+
+
+def test_plan_scene():
+    # a scene replays its sample after the plan has drawn others with the same steps
+    plan = Plan(gom_spec, shape=(128,64))
+    for seed in range(100):
+        vel = plan.generate(seed)
+        if plan.branches[2] >= 2:
+            # a salt branch
+            break
+    scene = Scene(plan.model)
+    assert np.array_equal(scene.rasterize(), vel)
+    for other in range(seed+1, seed+20):
+        plan.generate(other)
+    assert np.array_equal(scene.rasterize(), vel)
+
+
+def test_plan_weights(tmp_path):
+    spec = copy.deepcopy(gom_spec)
+    spec['shape'] = [64,32]
+    salt = spec['stages'][2]['choices']
+    for i, choice in enumerate(salt):
+        choice['weight'] = 1 if i == 2 else 0
+    path = str(tmp_path / 'plan.json')
+    Plan(spec).to_json(path)
+    plan = load_plan(path)
+    for seed in range(10):
+        plan.generate(seed)
+        assert plan.branches[2] == 2
+
+    vels = generate_dataset(plan, 4, workers=1, random_seed=3)
+    assert np.array_equal(vels[1], plan(np.random.SeedSequence(3).spawn(4)[1]))
+
+
+def test_workspace():
+    plan = Plan(gom_spec, shape=(128,64))
+    ref = [plan.generate(seed) for seed in range(20)]
+    # a model without a workspace draws the same samples
+    plan.model.workspace = None
+    plan.model.velocity = np.zeros(plan.shape, dtype=np.float32)
+    assert all(np.array_equal(plan.generate(seed), ref[seed]) for seed in range(20))
+
+    plan = Plan(gom_spec, shape=(128,64))
+    for seed in range(20):
+        plan.generate(seed, copy=False)
+    n = plan.workspace.allocations
+    for seed in range(20):
+        assert np.array_equal(plan.generate(seed, copy=False), ref[seed])
+    assert plan.workspace.allocations == n
+    assert plan.generate(0, copy=False) is plan.workspace.get('velocity', plan.shape)
@@ -0,0 +1,43 @@
+import numpy as np
+from velgen.model import Model, Pipeline
+from velgen.layer import FlatLayer, LinearWaterLayer
+from velgen.fold import CosineFold
+from velgen.products import box_filter, gaussian_smooth, Smooth, Slowness, GardnerDensity, to_records
+
+
+def test_smooth():
+    rng = np.random.default_rng(2)
+    vel = rng.uniform(1.5,4.5,size=(5,40,30)).astype(np.float32)
+    r = 3
+    padded = np.pad(vel, ((0,0),(r,r),(0,0)), mode='edge')
+    ref = np.mean([padded[:,k:k+40] for k in range(2*r+1)], axis=0)
+    assert np.allclose(box_filter(vel, [r]), ref)
+
+    smooth = gaussian_smooth(vel, (4,2))
+    assert smooth.shape == vel.shape and smooth.dtype == np.float32
+    assert np.array_equal(smooth[3], gaussian_smooth(vel[3], (4,2)))
+    assert np.allclose(gaussian_smooth(np.full((30,20), 2.5), 5), 2.5)
+
+    impulse = np.zeros((201,201))
+    impulse[100,100] = 1
+    x = np.arange(-100,101)
+    g = gaussian_smooth(impulse, 8)
+    assert np.isclose(g.sum(), 1)
+    assert abs(np.sqrt((g.sum(axis=1) * x**2).sum()) - 8) < 0.5
+
+
+def test_products():
+    model = Model((120,80), [1.5, 2.0, 2.5, 3.0, 3.5])
+    pipe = Pipeline([FlatLayer(), CosineFold(), LinearWaterLayer()], model,
+                    products=[Smooth(5), Smooth(5, slowness=True, name='smooth_slowness'), Slowness(), GardnerDensity()])
+    products = pipe.generate_products()
+    vel = products['velocity']
+    assert list(products) == ['velocity', 'smooth', 'smooth_slowness', 'slowness', 'density']
+    assert np.allclose(products['slowness'], 1/vel)
+    assert np.allclose(products['density'], 1.741 * vel**0.25)
+    assert products['smooth'].min() >= vel.min() and products['smooth'].max() <= vel.max()
+
+    batch = pipe.generate_products(n=3)
+    assert batch['smooth'].shape == (3,120,80)
+    records = to_records(batch)
+    assert len(records) == 3 and np.array_equal(records['density'], batch['density'])
@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+from velgen.model import Random
+
+
+def test_array_interval():
+    random = Random(0)
+    depth = random.array_interval_batch(1000, 10, 90, 24, 3, prepend=0, append=100)
+    assert depth.shape == (1000, 26)
+    assert np.diff(depth.astype(np.int32), axis=1).min() >= 3
+    assert random.count == 1
+
+    depth = random.array_interval(10, 90, 81, 1, prepend=0, append=100)
+    assert np.array_equal(depth, np.r_[0, 10:91, 100])
+
+    with pytest.raises(SystemExit):
+        random.array_interval(10, 90, 20, 5, prepend=0, append=100)
@@ -0,0 +1,40 @@
+import json
+import numpy as np
+from functools import partial
+from velgen.recipe import generate_recipe, regenerate, RecipeDataset, generate_recipes
+from velgen.util import gom_generator, linear_fault_generator
+
+
+def test_regenerate():
+    factory = partial(gom_generator, (200,100), 0.01)
+    for i in range(5):
+        vel, recipe = generate_recipe(factory)
+        recipe = json.loads(json.dumps(recipe))
+        assert np.array_equal(vel, regenerate(recipe))
+        assert len(json.dumps(recipe)) < 4096
+
+    factory = partial(linear_fault_generator, (128,100), np.array([1.5,2.0,2.5,3.0]))
+    vel, recipe = generate_recipe(factory, 3)
+    assert 'fault_vshift' in recipe['params'] and 'water_bottom' not in recipe['params']
+    assert np.array_equal(vel, regenerate(recipe))
+
+
+def test_recipe_dataset(tmp_path):
+    path = str(tmp_path / 'recipes.jsonl')
+    factory = partial(gom_generator, (128,100), 0.01)
+    dataset = generate_recipes(factory, RecipeDataset(path), 3, random_seed=2)
+    with open(path, 'a') as f:
+        f.write('{"factory": ')
+    dataset = generate_recipes(factory, RecipeDataset(path), 4, random_seed=2)
+    assert len(RecipeDataset(path)) == 4
+    vel, _ = generate_recipe(factory, np.random.SeedSequence(2).spawn(4)[3])
+    assert np.array_equal(dataset[3], vel)
+
+
+def test_plan_recipe():
+    from velgen.plan import Plan, gom_spec
+    plan = Plan(gom_spec, shape=(128,100))
+    vel, recipe = generate_recipe(plan, 5)
+    recipe = json.loads(json.dumps(recipe))
+    assert recipe['factory']['plan']['shape'] == [128,100]
+    assert np.array_equal(vel, regenerate(recipe))
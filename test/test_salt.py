@@ -0,0 +1,63 @@
+import numpy as np
+from velgen.model import Model, Pipeline
+from velgen.layer import FlatLayer
+from velgen.fold import CosineFold
+from velgen.salt import GaussianSalt
+from velgen.fill import fill_layers, const_velocity
+
+
+def loop_add_salt(salt, interface, nx, ny, x0, height, width, penetrate_interface):
+    interface_with_salt = interface.copy()
+    ninterface = len(interface)
+    neff_space = salt.eff_space * ny
+    iminspace = salt.minspace * ny
+    salt_top = ny - salt._salt(height, width, x0, nx, ny)
+    for i in range(1,ninterface-1):
+        hdiff = salt_top[:] - interface[i,:]
+        if hdiff.min() < neff_space:
+            if penetrate_interface:
+                h = abs(hdiff.min()) * (i/ninterface)
+            else:
+                h = abs(hdiff.min()) + iminspace
+            scale = 1 + (ninterface - i)/ninterface
+            si = salt._salt(h, width*scale, x0, nx, ny)
+            interface_with_salt[i] -= si.astype(np.int32)
+    if not penetrate_interface:
+        for i in reversed(range(1,ninterface)):
+            dmin = (interface_with_salt[i] - interface_with_salt[i-1]).min()
+            if dmin < iminspace:
+                interface_with_salt[i-1,:] = interface_with_salt[i-1,:] - abs(dmin) - int(iminspace)
+    return interface_with_salt
+
+
+def test_interface_parity():
+    rng = np.random.default_rng(3)
+    salt = GaussianSalt()
+    for t in range(100):
+        nx, ny = rng.integers(4,120,size=2)
+        nlayers = rng.integers(1,12)
+        interface = np.sort(rng.integers(0,ny+1,size=(nlayers+1,nx)), axis=0).astype(np.int32)
+        interface[0], interface[-1] = 0, ny
+        x0 = np.float32(rng.uniform(0.2,0.8)) * nx
+        height = np.float32(rng.uniform(0.2,0.6)) * ny
+        width = np.float32(rng.uniform(0.1,0.2)) * nx
+        for penetrate_interface in (True, False):
+            ref = loop_add_salt(salt, interface, nx, ny, x0, height, width, penetrate_interface)
+            out = salt._add_salt_to_interface(interface, nx, ny, x0, height, width, penetrate_interface)
+            assert np.array_equal(ref, out)
+
+
+def test_salt_envelope():
+    # salts merged into the running envelope paint the same model as every salt top in turn
+    shape = (160,80)
+    for seed in range(4):
+        steps = [FlatLayer(random_seed=seed), CosineFold(random_seed=seed+1)]
+        steps += [GaussianSalt(vsalt=v, random_seed=seed+i+2) for i, v in enumerate([4.5, 4.5, 5., 4.5])]
+        model = Model(shape, np.linspace(1.5,3.5,8), random_seed=seed)
+        vel = Pipeline(steps).generate(model)
+        ref = fill_layers(np.zeros(shape, dtype=np.float32), model.interface, model.fill_draws[-1], const_velocity)
+        for top, vsalt in zip(model.history['gaussian_salt_top'], model.history['gaussian_vsalt']):
+            for ix in range(shape[0]):
+                ref[ix,int(top[ix]):] = vsalt
+        assert np.array_equal(vel, ref)
+        assert len(model.salt_envelope) == 3
@@ -0,0 +1,33 @@
+import os
+import numpy as np
+from velgen.plan import Plan, gom_spec
+from velgen.store import DatasetStore
+from velgen.dataset import generate_dataset
+from velgen.shards import ShardedJob, generate_sharded
+
+
+def test_sharded(tmp_path):
+    plan = Plan(gom_spec, shape=(64,32))
+    ref = generate_dataset(plan, 20, workers=1, random_seed=3)
+
+    path = str(tmp_path / 'one')
+    job = generate_sharded(path, 20, plan, shard_size=6, random_seed=3)
+    store = DatasetStore(path)
+    assert len(store) == 20 and store.shape == (64,32)
+    assert np.array_equal(np.stack([store[i] for i in range(20)]), ref)
+    assert job.summary()['nshards'] == 4
+
+    # workers taking one shard each, and a dead worker's claim taken over
+    path = str(tmp_path / 'many')
+    job = ShardedJob(path, 20, plan, shard_size=6, random_seed=3, stale=60.)
+    dead = job.claim(2, 0)
+    os.utime(dead, (0, 0))
+    for worker in range(3):
+        assert ShardedJob(path, 20, plan, shard_size=6, random_seed=3, stale=60.).run(1, wait=False) == 1
+    assert not os.path.exists(os.path.join(path, 'manifest.json'))
+    ShardedJob(path).run(wait=False)
+    store = DatasetStore(path)
+    assert np.array_equal(np.stack([store[i] for i in range(20)]), ref)
+    summary = ShardedJob(path).summary()
+    assert summary['shards'][2]['claim'] == 1
+    assert store.history(7) == DatasetStore(str(tmp_path / 'one')).history(7)
@@ -0,0 +1,41 @@
+import numpy as np
+from functools import partial
+from velgen.store import DatasetStore
+from velgen.dataset import generate_dataset, generate_to_store
+from velgen.util import gom_generator
+
+
+def test_store_resume(tmp_path):
+    shape = (64,48)
+    factory = partial(gom_generator, shape, 0.01)
+    ref = generate_dataset(factory, 7, workers=1, random_seed=3)
+
+    store = DatasetStore(str(tmp_path), shape=shape, shard_size=3, flush_every=2)
+    generate_to_store(factory, store, 4, random_seed=3)
+    store.append(np.zeros(shape))  # never committed to the manifest
+    del store
+
+    store = DatasetStore(str(tmp_path))
+    assert len(store) == 4
+    generate_to_store(factory, store, 7, random_seed=3)
+    store.close()
+
+    store = DatasetStore(str(tmp_path))
+    assert len(store) == 7
+    for i in range(7):
+        assert isinstance(store[i], np.memmap)
+        assert np.array_equal(store[i], ref[i])
+    assert 'water_bottom' in store.history(5)
+
+
+def test_store_seed_sequence(tmp_path):
+    # a SeedSequence is kept in the manifest as its entropy and spawn key
+    shape = (64,48)
+    factory = partial(gom_generator, shape, 0.01)
+    root = np.random.SeedSequence(5).spawn(2)[1]
+    ref = generate_dataset(factory, 4, workers=1, random_seed=root)
+    generate_to_store(factory, DatasetStore(str(tmp_path), shape=shape, shard_size=3), 2, random_seed=root)
+    store = generate_to_store(factory, DatasetStore(str(tmp_path)), 4, random_seed=root)
+    assert store.attrs['random_seed']['spawn_key'] == [1]
+    for i in range(4):
+        assert np.array_equal(store[i], ref[i])
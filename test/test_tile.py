@@ -0,0 +1,51 @@
+import tracemalloc
+import numpy as np
+from velgen.model import Model, Pipeline
+from velgen.layer import DippingLayer, LinearWaterLayer
+from velgen.fold import CosineFold
+from velgen.fault import LinearFault
+from velgen.salt import GaussianSalt, EllipticSalt
+
+
+def pipeline(seed, subpixel=False, labels=False):
+    model = Model((300,120), np.linspace(1.5,4.,12), random_seed=seed, labels=labels)
+    steps = [DippingLayer(random_seed=seed+1), CosineFold(random_seed=seed+2),
+             LinearFault(subpixel=subpixel, random_seed=seed+3), GaussianSalt(random_seed=seed+4),
+             EllipticSalt(nbodies=2, angle_range=(-30,30), random_seed=seed+5),
+             LinearWaterLayer(random_seed=seed+6)]
+    return Pipeline(steps, model)
+
+
+def test_tiled(tmp_path):
+    for seed in range(4):
+        for subpixel in (False, True):
+            ref = pipeline(seed, subpixel).generate()
+            # tiles narrower than the fault throws still match the full grid
+            vel = pipeline(seed, subpixel).generate_tiled(tile=17)
+            assert np.array_equal(vel, ref)
+
+    pipe = pipeline(7, labels=True)
+    ref = pipe.generate().copy()
+    ref_labels = pipe.model.labels.copy()
+    path, labels_path = str(tmp_path / 'vel.npy'), str(tmp_path / 'labels.npy')
+    vel = pipeline(7, labels=True).generate_tiled(path, tile=50, workers=3, labels_path=labels_path)
+    assert isinstance(vel, np.memmap)
+    assert np.array_equal(np.load(path), ref)
+    assert np.array_equal(np.load(labels_path), ref_labels)
+
+
+def test_tiled_memory(tmp_path):
+    # the model allocates no full-size grid: the whole call stays under one float32 grid
+    shape = (6000,400)
+    tracemalloc.start()
+    try:
+        model = Model(shape, np.linspace(1.5,4.,12), random_seed=3, labels=True, masks=True)
+        steps = [DippingLayer(random_seed=4), CosineFold(random_seed=5), LinearFault(random_seed=6),
+                 GaussianSalt(random_seed=7), LinearWaterLayer(random_seed=8)]
+        Pipeline(steps, model).generate_tiled(str(tmp_path / 'vel.npy'), tile=100,
+                                              labels_path=str(tmp_path / 'labels.npy'),
+                                              masks_path=str(tmp_path / 'masks.npy'))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < shape[0]*shape[1]*4
@@ -5,3 +5,13 @@ from .fold import CosineFold
 from .fault import LinearFault
 from .salt import GaussianSalt, EllipticSalt
 
+from .dataset import generate_dataset, generate_to_store
+from .store import DatasetStore
+from .instrument import StepProfiler
+from .recipe import generate_recipe, regenerate, RecipeDataset
+from .scene import Scene
+from .plan import Plan, load_plan
+from .products import Smooth, Slowness, GardnerDensity
+from .workspace import Workspace
+from .dedup import DuplicateIndex
+from .shards import generate_sharded
@@ -0,0 +1,206 @@
+import os
+import queue
+import traceback
+import multiprocessing as mp
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from . import kernels
+from .model import Pipeline, errexit, seed_sequence, seed_json, sample_seed
+
+
+def _mp_context():
+    # numba's parallel threads do not survive a fork once they have run, so workers of the
+    # numba backend start from a forkserver (the factory must then be picklable)
+    return mp.get_context('forkserver' if kernels.backend == 'numba' else None)
+
+
+def generate_sample(factory, random_seed):
+    # factory(random_seed=...) returns a Pipeline with a model, or a velocity array
+    out = factory(random_seed=random_seed)
+    if isinstance(out, Pipeline):
+        out = out.generate()
+    return out
+
+
+def generate_to_store(factory, store, n, random_seed=None):
+    # appends samples len(store)..n-1, so an interrupted run resumes where the manifest left off
+    if random_seed is not None:
+        seed = seed_json(random_seed)
+        if seed_json(store.attrs.setdefault('random_seed', seed)) != seed:
+            errexit("Dataset was generated with random_seed=%s"%store.attrs['random_seed'])
+    root = seed_sequence(random_seed)
+    for i in range(len(store), n):
+        out = factory(random_seed=sample_seed(root, i))
+        history = None
+        if isinstance(out, Pipeline):
+            pipe, out = out, out.generate()
+            history = pipe.model.history if pipe.model is not None else None
+        store.append(out, history)
+    store.flush()
+    return store
+
+
+def _open_output(output, shape):
+    kind, where = output
+    if kind == 'shm':
+        shm = shared_memory.SharedMemory(name=where)
+        return shm, np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    return None, np.load(where, mmap_mode='r+')
+
+
+def _generate_chunk(factory, output, shape, start, seeds):
+    shm, arr = _open_output(output, shape)
+    try:
+        for i, seed in enumerate(seeds):
+            arr[start+i] = generate_sample(factory, seed)
+        if shm is None:
+            arr.flush()
+    finally:
+        del arr
+        if shm is not None:
+            shm.close()
+    return len(seeds)
+
+
+def _chunks(start, stop, chunksize):
+    for i in range(start, stop, chunksize):
+        yield i, min(i+chunksize, stop)
+
+
+def generate_dataset(factory, n, workers=None, random_seed=None, path=None, chunksize=None):
+    # sample i uses the i-th child of SeedSequence(random_seed), so the output does not
+    # depend on the number of workers; workers write to shared memory or to the .npy at path
+    if n < 1:
+        errexit("At least one sample is required")
+    workers = workers or os.cpu_count() or 1
+    root = seed_sequence(random_seed)
+    seeds = [sample_seed(root, i) for i in range(n)]
+
+    # the first sample fixes the output shape
+    vel0 = generate_sample(factory, seeds[0])
+    shape = (n,) + vel0.shape
+
+    shm = None
+    if path is not None:
+        arr = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=shape)
+        output = ('npy', path)
+    else:
+        nbytes = int(np.prod(shape)) * np.dtype(np.float32).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(nbytes,1))
+        arr = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        output = ('shm', shm.name)
+    arr[0] = vel0
+
+    try:
+        if workers <= 1 or n == 1:
+            for i in range(1, n):
+                arr[i] = generate_sample(factory, seeds[i])
+        else:
+            if path is not None:
+                arr.flush()
+            chunksize = chunksize or max(1, -(-(n-1) // (workers*4)))
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_mp_context(),
+                                     initializer=kernels.use_backend, initargs=(kernels.backend,)) as pool:
+                futures = [pool.submit(_generate_chunk, factory, output, shape, i0, seeds[i0:i1])
+                           for i0, i1 in _chunks(1, n, chunksize)]
+                for future in futures:
+                    future.result()
+        if path is not None:
+            arr.flush()
+            return np.load(path, mmap_mode='r')
+        return arr.copy()
+    finally:
+        arr = None
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+
+def _generate_batch(factory, root, batch, batch_size, out, start=0):
+    for j in range(start, batch_size):
+        out[j] = generate_sample(factory, sample_seed(root, batch*batch_size+j))
+
+
+def _stream_worker(factory, root, batch_size, shm_name, shape, tasks, done, backend):
+    kernels.use_backend(backend)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            batch, slot, start = task
+            try:
+                _generate_batch(factory, root, batch, batch_size, slots[slot], start)
+                done.put((batch, slot, None))
+            except Exception:
+                done.put((batch, slot, traceback.format_exc()))
+    finally:
+        slots = None
+        shm.close()
+
+
+def stream(factory, batch_size, prefetch=2, workers=1, random_seed=None, copy=True):
+    # infinite iterator of (batch_size, nx, ny) batches; batch b holds samples
+    # b*batch_size.. with the same seeds as generate_dataset, whatever the worker count.
+    # At most `prefetch` batches are in flight, each in its own shared memory slot,
+    # so workers beyond `prefetch` stay idle.
+    root = seed_sequence(random_seed)
+    if workers < 1:
+        batch = 0
+        while True:
+            vels = [generate_sample(factory, sample_seed(root, batch*batch_size+j)) for j in range(batch_size)]
+            yield np.stack(vels).astype(np.float32, copy=False)
+            batch += 1
+
+    # the first sample fixes the slot shape and stays in place as batch 0's first row
+    vel0 = generate_sample(factory, sample_seed(root, 0))
+    nslots = max(prefetch, 1)
+    shape = (nslots, batch_size) + vel0.shape
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape))*4)
+    slots = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    slots[0, 0] = vel0
+    ctx = _mp_context()
+    tasks, done = ctx.Queue(), ctx.Queue()
+    procs = [ctx.Process(target=_stream_worker, args=(factory, root, batch_size, shm.name, shape, tasks, done, kernels.backend), daemon=True)
+             for _ in range(workers)]
+    try:
+        for p in procs:
+            p.start()
+        for slot in range(nslots):
+            tasks.put((slot, slot, 1 if slot == 0 else 0))
+        ready = {}
+        batch = 0
+        while True:
+            while batch not in ready:
+                try:
+                    b, slot, error = done.get(timeout=1)
+                except queue.Empty:
+                    # a worker killed outside python (OOM, signal) never reports back
+                    dead = [p for p in procs if not p.is_alive()]
+                    if dead:
+                        raise RuntimeError("velgen stream worker exited with code %s"%dead[0].exitcode)
+                    continue
+                if error is not None:
+                    raise RuntimeError("velgen stream worker failed on batch %d:\n%s"%(b, error))
+                ready[b] = slot
+            slot = ready.pop(batch)
+            yield slots[slot].copy() if copy else slots[slot]
+            # the slot is reused only after the consumer asked for the next batch
+            tasks.put((batch+nslots, slot, 0))
+            batch += 1
+    finally:
+        for p in procs:
+            tasks.put(None)
+        for p in procs:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        tasks.close()
+        done.close()
+        slots = None
+        shm.close()
+        shm.unlink()
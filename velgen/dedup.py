@@ -0,0 +1,120 @@
+import numpy as np
+from .model import errexit
+
+
+def _bins(n, m):
+    edges = np.linspace(0, n, m+1).astype(np.intp)
+    if np.any(np.diff(edges) == 0):
+        errexit("Cannot reduce %d cells to %d blocks"%(n, m))
+    return edges[:-1], np.diff(edges)
+
+
+def signature(vel, size=(16,8)):
+    # block means of the velocity on a size grid, flattened; one row per model for a batch.
+    # Layer boundaries, salt and faults all show in it, and it does not depend on the grid.
+    vel = np.asarray(vel, dtype=np.float32)
+    (sx, cx), (sy, cy) = _bins(vel.shape[-2], size[0]), _bins(vel.shape[-1], size[1])
+    sig = np.add.reduceat(np.add.reduceat(vel, sx, axis=-2), sy, axis=-1)
+    sig /= cx[:,None] * cy[None,:]
+    return sig.reshape(vel.shape[:-2] + (-1,))
+
+
+class DuplicateIndex:
+    # near-duplicate index over model signatures: two models are duplicates if the RMS
+    # difference of their signatures is at most tol (velocity units). Candidates come from
+    # p-stable LSH tables (ntables keys of nhashes quantized random projections each, bucket
+    # width bucket*tol) and are checked exactly, so a reported duplicate is always within tol;
+    # one within tol is missed with a probability that falls with ntables.
+    def __init__(self, tol=0.02, size=(16,8), ntables=8, nhashes=4, bucket=4., random_seed=0):
+        self.tol = tol
+        self.size = tuple(size)
+        self.ntables = ntables
+        self.nhashes = nhashes
+        self.bucket = bucket
+        ndim = self.size[0] * self.size[1]
+        rng = np.random.default_rng(random_seed)
+        self.width = bucket * tol * np.sqrt(ndim)
+        self.proj = rng.standard_normal((ndim, ntables*nhashes)).astype(np.float32)
+        self.offset = rng.uniform(0, self.width, ntables*nhashes)
+        self.tables = [{} for _ in range(ntables)]
+        self.sigs = np.empty((1024, ndim), dtype=np.float32)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def keys(self, sigs):
+        # (n, ntables) bucket keys
+        h = np.floor((sigs @ self.proj + self.offset) / self.width).astype(np.int32)
+        h = h.reshape(len(sigs), self.ntables, self.nhashes)
+        return [[row.tobytes() for row in sample] for sample in h]
+
+    def _query(self, sig, keys):
+        cands = set()
+        for table, key in zip(self.tables, keys):
+            cands.update(table.get(key, ()))
+        if not cands:
+            return -1
+        cands = np.fromiter(cands, dtype=np.intp, count=len(cands))
+        d = self.sigs[cands] - sig
+        dist = np.einsum('ij,ij->i', d, d)
+        i = np.argmin(dist)
+        if dist[i] <= self.tol**2 * len(sig):
+            return int(cands[i])
+        return -1
+
+    def _insert(self, sig, keys):
+        if self.count == len(self.sigs):
+            self.sigs = np.concatenate([self.sigs, np.empty_like(self.sigs)])
+        i = self.count
+        self.sigs[i] = sig
+        for table, key in zip(self.tables, keys):
+            table.setdefault(key, []).append(i)
+        self.count += 1
+        return i
+
+    def query(self, vels):
+        # index of a near duplicate of each model (or of one model), -1 if none
+        vels = np.asarray(vels)
+        sigs = signature(vels, self.size).reshape(-1, self.sigs.shape[1])
+        out = np.array([self._query(s, k) for s, k in zip(sigs, self.keys(sigs))], dtype=np.int64)
+        return out if vels.ndim == 3 else int(out[0])
+
+    def add(self, vels, reject=True):
+        # queries and adds the models in order, so duplicates within a batch are found too.
+        # Returns the index of each model's near duplicate, -1 for new models; with reject,
+        # duplicates are not added.
+        vels = np.asarray(vels)
+        sigs = signature(vels, self.size).reshape(-1, self.sigs.shape[1])
+        out = np.empty(len(sigs), dtype=np.int64)
+        for j, (sig, keys) in enumerate(zip(sigs, self.keys(sigs))):
+            out[j] = self._query(sig, keys)
+            if out[j] < 0 or not reject:
+                self._insert(sig, keys)
+        return out if vels.ndim == 3 else int(out[0])
+
+    def save(self, path):
+        np.savez(path, sigs=self.sigs[:self.count], proj=self.proj, offset=self.offset, tol=self.tol,
+                 size=self.size, ntables=self.ntables, nhashes=self.nhashes, bucket=self.bucket)
+
+    @classmethod
+    def load(cls, path):
+        # the tables are rebuilt from the signatures
+        f = np.load(path)
+        index = cls(float(f['tol']), tuple(f['size']), int(f['ntables']), int(f['nhashes']), float(f['bucket']))
+        index.proj, index.offset = f['proj'], f['offset']
+        sigs = f['sigs']
+        for sig, keys in zip(sigs, index.keys(sigs)):
+            index._insert(sig, keys)
+        return index
+
+
+def unique(batches, index, reject=True):
+    # filters a stream of batches: duplicates of any earlier model are dropped, or with
+    # reject=False every batch comes with the index of each model's near duplicate
+    for batch in batches:
+        dup = index.add(batch, reject)
+        if reject:
+            yield batch[dup < 0]
+        else:
+            yield batch, dup
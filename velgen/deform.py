@@ -0,0 +1,123 @@
+import numpy as np
+from .kernels import kernel
+from .workspace import scratch
+from .fill import mask_bits
+
+
+class FaultField:
+    # backward map of one linear fault: cells left of the fault line take the value at
+    # (x - hshift, y - vshift). With subpixel, the line and the throw are not rounded.
+    def __init__(self, it, ib, vshift, ny, subpixel=False, zone=1):
+        self.subpixel = subpixel
+        # cells closer than zone to the fault line (across it, not along x) are in its zone
+        # in the segmentation masks
+        self.zone = zone * np.hypot(1., (ib-it)/max(ny-1, 1))
+        igrad = abs(it-ib)/ny
+        if subpixel:
+            self.it, self.ib = float(it), float(ib)
+            self.vshift = float(vshift)
+            self.hshift = igrad*self.vshift
+        else:
+            self.line = np.linspace(it,ib,ny).astype(np.int32)
+            self.vshift = int(vshift)
+            self.hshift = int(igrad*vshift)
+
+    def line_at(self, y, ny):
+        if self.subpixel:
+            return self.it + (self.ib - self.it) * y / max(ny-1, 1)
+        if y.dtype.kind == 'f':
+            y = np.clip(np.floor(y), 0, ny-1).astype(np.intp)
+        return self.line[y]
+
+    def near(self, x, y, ny, out):
+        # cells within zone of the fault line, in the coordinates right after this fault
+        line = self.line_at(y, ny)
+        np.less(np.abs(x - line), self.zone, out=out)
+        return out
+
+    def pull(self, x, y, nx, ny):
+        # moves the coordinates in place
+        inside = x < self.line_at(y, ny)
+        np.subtract(x, self.hshift, out=x, where=inside, casting='unsafe')
+        np.clip(x, 0, nx-1, out=x)
+        np.subtract(y, self.vshift, out=y, where=inside, casting='unsafe')
+        np.clip(y, 0, ny-1, out=y)
+        return x, y
+
+
+def compose(fields, nx, ny, ws=None, offset=0, width=None, zone=None):
+    # source coordinates of every cell after all fields, applied in order; for a window of
+    # width columns from offset, still in the coordinates of the whole grid. A zone grid
+    # collects the cells that end up in a fault zone.
+    width = nx if width is None else width
+    dtype = np.float64 if any(f.subpixel for f in fields) else np.int32
+    x = scratch(ws, 'warp_x', (width, ny), dtype)
+    y = scratch(ws, 'warp_y', (width, ny), dtype)
+    x[...] = np.arange(offset, offset+width)[:,None]
+    y[...] = np.arange(ny)[None,:]
+    if zone is not None:
+        zone[...] = False
+        near = scratch(ws, 'warp_near', (width, ny), bool)
+    for field in reversed(fields):
+        if zone is not None:
+            zone |= field.near(x, y, ny, near)
+        x, y = field.pull(x, y, nx, ny)
+    return x, y
+
+
+def resample(arr, x, y, linear=False, ws=None, offset=0, nx=None):
+    # arr holds the columns offset.. of a grid nx wide, x the grid coordinates; sources
+    # outside the window are clamped to its edge
+    width, ny = arr.shape
+    nx = width if nx is None else nx
+    flat = arr.reshape(-1)
+    if not linear:
+        if x.dtype.kind == 'f':
+            x, y = np.rint(x), np.rint(y)
+        index = scratch(ws, 'warp_index', (width, ny), np.intp)
+        np.subtract(x, offset, out=index, casting='unsafe')
+        if offset or width < nx:
+            np.clip(index, 0, width-1, out=index)
+        np.multiply(index, ny, out=index)
+        np.add(index, y, out=index, casting='unsafe')
+        return np.take(flat, index, out=scratch(ws, 'warp_out', (width, ny), arr.dtype), mode='clip')
+    x0 = np.floor(x).astype(np.intp)
+    y0 = np.floor(y).astype(np.intp)
+    fx, fy = x - x0, y - y0
+    x1, y1 = np.minimum(x0+1, nx-1), np.minimum(y0+1, ny-1)
+    if offset or width < nx:
+        x0 = np.clip(x0 - offset, 0, width-1)
+        x1 = np.clip(x1 - offset, 0, width-1)
+    v00, v10 = np.take(flat, x0*ny + y0), np.take(flat, x1*ny + y0)
+    v01, v11 = np.take(flat, x0*ny + y1), np.take(flat, x1*ny + y1)
+    out = (v00 * (1-fx) + v10 * fx) * (1-fy) + (v01 * (1-fx) + v11 * fx) * fy
+    return out.astype(arr.dtype)
+
+
+def reach(fields):
+    # how many columns away a cell can take its value from, interpolation included
+    return sum(int(np.ceil(abs(f.hshift))) + f.subpixel for f in fields)
+
+
+def warp(vel, labels, fields, ws=None, offset=0, nx=None, masks=None):
+    # one resample of the velocity (linear if any field is sub-pixel), the labels and the
+    # masks (always nearest) through the composition of the fields; the fault zones are
+    # added to the masks. Whole-pixel faults on the velocity alone are cheaper one by one:
+    # each only gathers the block it moves.
+    # vel may be the columns offset.. of a grid nx wide; the fields are in grid coordinates.
+    width, ny = vel.shape
+    nx = width if nx is None else nx
+    if labels is None and masks is None and not any(f.subpixel for f in fields):
+        for f in fields:
+            line = f.line - offset if offset else f.line
+            kernel('fault_shift')(vel, line, f.hshift, f.vshift, ws)
+        return vel
+    zone = None if masks is None else scratch(ws, 'warp_zone', (width, ny), bool)
+    x, y = compose(fields, nx, ny, ws, offset, width, zone)
+    vel[...] = resample(vel, x, y, x.dtype.kind == 'f', ws, offset, nx)
+    if labels is not None:
+        labels[...] = resample(labels, x, y, ws=ws, offset=offset, nx=nx)
+    if masks is not None:
+        masks[...] = resample(masks, x, y, ws=ws, offset=offset, nx=nx)
+        np.bitwise_or(masks, mask_bits['fault'], out=masks, where=zone)
+    return vel
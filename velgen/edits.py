@@ -0,0 +1,25 @@
+import numpy as np
+from .kernels import kernel
+
+
+class ColumnFill:
+    # edit op: the 'fill_above' or 'fill_below' kernel with per-column bounds, on the
+    # velocity and, with the label values and mask bits, on the labels and masks
+    def __init__(self, name, bounds, values, label_values=None, ws=None, mask_values=0):
+        self.name = name
+        self.bounds = np.asarray(bounds)
+        self.values = values
+        self.label_values = label_values
+        self.mask_values = mask_values
+        self.ws = ws
+
+    def __call__(self, vel, labels, masks=None):
+        kernel(self.name)(vel, self.bounds, self.values, self.ws)
+        if labels is not None:
+            kernel(self.name)(labels, self.bounds, self.label_values, self.ws)
+        if masks is not None:
+            kernel(self.name)(masks, self.bounds, self.mask_values, self.ws)
+
+    def crop(self, x0, x1, ws=None):
+        # the same edit on the columns x0:x1
+        return ColumnFill(self.name, self.bounds[...,x0:x1], self.values, self.label_values, ws, self.mask_values)
@@ -1,10 +1,16 @@
 import numpy as np
 from .model import Random
+from .kernels import kernel
+from .deform import FaultField
 
 
 class LinearFault:
-    def __init__(self, nfaults=None, vshift=None, max_nfaults=3, lpad=0.1, rpad=0.1, vshift_range=(0.05,0.15), random_seed=None, vround=4):
+    def __init__(self, nfaults=None, vshift=None, max_nfaults=3, lpad=0.1, rpad=0.1, vshift_range=(0.05,0.15), subpixel=False, zone=1, random_seed=None, vround=4):
         self.random = Random(random_seed, vround)
+        # sub-pixel fault lines and throws, resampled with linear interpolation
+        self.subpixel = subpixel
+        # cells closer than zone to a fault line are marked in the segmentation masks
+        self.zone = zone
         self.nfaults = nfaults
         self.vshift = vshift
         self.max_nfaults = max_nfaults
@@ -13,19 +19,18 @@ class LinearFault:
         self.vshift_min=vshift_range[0]
         self.vshift_max=vshift_range[1]
 
-    def _gen_fault_lines(self,nfaults,nx):
+    def _gen_fault_lines(self,nfaults):
         top = self.random.array(low=self.lpad, high=1-self.rpad, size=nfaults)
         bottom = self.random.array(low=self.lpad, high=1-self.rpad, size=nfaults)
-        itop = (top*nx).astype(np.int32)
-        ibottom = (bottom*nx).astype(np.int32)
-        return itop, ibottom
+        return top, bottom
 
     def _get_vshifts(self,nfaults,ny):
         ivshift_min=int(ny * self.vshift_min)
         ivshift_max=int(ny * self.vshift_max)
         if self.vshift is None:
             shift_sign = self.random.choice((-1,1))
-            vshifts = self.random.uniform(ivshift_min, ivshift_max, size=nfaults, dtype=np.int32)*shift_sign
+            dtype = np.float32 if self.subpixel else np.int32
+            vshifts = self.random.uniform(ivshift_min, ivshift_max, size=nfaults, dtype=dtype)*shift_sign
         else:
             vshifts = np.ones(nfaults, dtype=np.int32) * self.vshift
         return vshifts
@@ -33,34 +38,40 @@ class LinearFault:
     def add_fault(self, vel, it, ib, vshift, ny):
         fault_line = np.linspace(it,ib,ny).astype(np.int32)
         igrad = abs(it-ib)/ny
-
         hshift = int(igrad*vshift)
-        vpad = abs(vshift)
-        hpad = abs(hshift)
-
-        velpad = np.pad(vel, [(hpad,hpad),(vpad,vpad)],mode='edge')
-        velnew = vel.copy()
-
-        for iy in range(ny):
-            for ix in range(fault_line[iy]):
-                velnew[ix,iy] = velpad[ix+hpad-hshift, iy+vpad-vshift]
-        return velnew
+        return kernel('fault_shift')(vel, fault_line, hshift, vshift)
 
-    def generate(self, model):
+    def sample(self, model):
         nx,ny = model.shape
         if self.nfaults is not None:
             nfaults = self.nfaults 
         else:
             nfaults = self.random.choice(np.arange(1,self.max_nfaults+1,dtype=np.int32))
-        itops,ibottoms = self._gen_fault_lines(nfaults,nx)
+        top,bottom = self._gen_fault_lines(nfaults)
         vshifts = self._get_vshifts(nfaults,ny)
+        return dict(shape=model.shape, top=top, bottom=bottom, vshifts=vshifts)
 
-        vel = model.generate()
+    def apply(self, model, params):
+        nx,ny = model.shape
+        sx, sy = model.scale(params)
+        if self.subpixel:
+            itops = params['top']*nx
+            ibottoms = params['bottom']*nx
+            vshifts = params['vshifts']*sy
+        else:
+            itops = (params['top']*nx).astype(np.int32)
+            ibottoms = (params['bottom']*nx).astype(np.int32)
+            vshifts = np.round(params['vshifts']*sy).astype(np.int32)
+
+        # one displacement field per fault, resampled together with the next edit
         for i,(it,ib) in enumerate(zip(reversed(itops), reversed(ibottoms))):
-            vel = self.add_fault(vel,it,ib,vshifts[i],ny)
-        model.set_velocity(vel)
+            model.warp(FaultField(it,ib,vshifts[i],ny,self.subpixel,self.zone))
         model.add_history('fault_top',itops)
         model.add_history('fault_bottom',ibottoms)
+        model.add_history('fault_vshift',vshifts)
         return model
 
+    def generate(self, model):
+        return self.apply(model, model.record(self, self.sample(model)))
+
 
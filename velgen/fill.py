@@ -0,0 +1,113 @@
+import numpy as np
+from .workspace import scratch
+
+
+def slice_bounds(interface, ny):
+    # interface depths as python slice bounds: negative values wrap, then clip to [0,ny]
+    bounds = np.where(interface < 0, interface + ny, interface)
+    return np.clip(bounds, 0, ny)
+
+
+def covers_grid(interface, ny):
+    # monotonic interfaces from the top to the bottom of the grid fill every cell
+    bounds = slice_bounds(interface, ny)
+    return bool((bounds[0] == 0).all() and (bounds[-1] == ny).all() and (np.diff(bounds, axis=0) >= 0).all())
+
+
+def layer_index(interface, ny, ws=None):
+    # index of the last layer whose [top,bottom) slice covers each cell, -1 if none
+    nb, nx = interface.shape
+    nlayers = nb - 1
+    bounds = slice_bounds(interface, ny)
+    cols = np.arange(nx)
+
+    marker = scratch(ws, 'marker', (nx, ny+1), np.int32)
+    marker[...] = -1
+    for i in range(nlayers):
+        marker[cols, bounds[i]] = i
+    label = np.maximum.accumulate(marker[:,:ny], axis=1, out=scratch(ws, 'label', (nx, ny), np.int32))
+
+    # only the deepest layer can start above a cell without covering it
+    iy = np.arange(ny)
+    outside = np.equal(label, nlayers-1, out=scratch(ws, 'outside', (nx, ny), bool))
+    outside &= np.greater_equal(iy[None,:], bounds[-1][:,None], out=scratch(ws, 'mask', (nx, ny), bool))
+    if outside.any():
+        bx, by = np.nonzero(outside)
+        sub = np.full(len(bx), -1, dtype=np.int32)
+        for i in range(nlayers):
+            sub[(bounds[i,bx] <= by) & (by < bounds[i+1,bx])] = i
+        label[bx, by] = sub
+    return label, bounds
+
+
+def const_velocity(velseed, layer, ix, k, n, nx):
+    return velseed[layer]
+
+
+def vlinear_velocity(velseed, layer, ix, k, n, nx):
+    # same arithmetic as np.linspace(v0, v1, n)[k]
+    v0 = velseed[layer,0]
+    v1 = velseed[layer,1]
+    step = (v1 - v0) / np.maximum(n-1, 1)
+    vel = k * step + v0
+    return np.where((k == n-1) & (n > 1), v1, vel)
+
+
+def lateral_velocity(velseed, layer, ix, k, n, nx):
+    # velocity varies linearly from velseed[:,0] at ix=0 to velseed[:,1] at ix=nx-1
+    v0 = velseed[layer,0]
+    v1 = velseed[layer,1]
+    return v0 + (v1 - v0) * ix / max(nx-1, 1)
+
+
+# bits of the segmentation mask grid (Model(masks=True))
+mask_bits = {'fault': 1, 'salt': 2, 'water': 4}
+
+
+velocity_functions = {
+    'constant': const_velocity,
+    'linear': vlinear_velocity,
+    'vlinear': vlinear_velocity,
+    'lateral': lateral_velocity,
+}
+
+
+def fill_layers(vel, interface, velseed, func=const_velocity, labels=None, ws=None, masks=None):
+    # labels get the layer index, masks are cleared on the filled cells
+    nx, ny = vel.shape
+    label, bounds = layer_index(interface, ny, ws)
+    velseed = np.asarray(velseed)
+    if labels is not None:
+        if label.min() >= 0:
+            np.copyto(labels, label, casting='unsafe')
+        else:
+            np.copyto(labels, label, casting='unsafe', where=label >= 0)
+    if masks is not None:
+        if label.min() >= 0:
+            masks[...] = 0
+        else:
+            np.copyto(masks, 0, where=label >= 0)
+    if func is const_velocity:
+        table = velseed.astype(vel.dtype)
+        if label.min() >= 0:
+            # take only writes into out without a temporary for intp indices and mode='clip'
+            index = scratch(ws, 'index', (nx, ny), np.intp)
+            index[...] = label
+            np.take(table, index, out=vel, mode='clip')
+        else:
+            covered = label >= 0
+            vel[covered] = table[label[covered]]
+        return vel
+
+    ix, iy = np.indices((nx, ny))
+    covered = label >= 0
+    if not covered.all():
+        ix, iy, label = ix[covered], iy[covered], label[covered]
+    top = bounds[label, ix]
+    n = bounds[label+1, ix] - top
+    values = func(velseed, label, ix, iy - top, n, nx)
+    if covered.all():
+        vel[...] = values
+    else:
+        vel[covered] = values
+    return vel
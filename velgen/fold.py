@@ -16,6 +16,20 @@ class CosineFold:
         a1 = self.random.uniform(low=1, high=self.amax * ny)
         h1 = self.random.uniform(low=1, high=self.hmax * nx)
         r1 = self.random.array(0,1,nx,sort=True)
+        return a1, h1, r1
+
+    def _cosine(self,a1,h1,r1,sx,sy):
+        # r1 are sorted positions in [0,1], one per column of the sampled grid
+        nx = int(round(len(r1) * sx))
+        if nx != len(r1):
+            r1 = np.interp(np.linspace(0,1,nx), np.linspace(0,1,len(r1)), r1)
+        return np.round(a1 * sy * np.cos(h1 * np.pi * r1),self.vround).astype(self.dtype)
+
+    def _gen_cosine_batch(self,n,nx,ny):
+        a1 = self.random.uniform(low=1, high=self.amax * ny, size=(n,1))
+        h1 = self.random.uniform(low=1, high=self.hmax * nx, size=(n,1))
+        r1 = self.random.uniform(0, 1, size=(n,nx))
+        r1.sort(axis=1)
         return np.round(a1 * np.cos(h1 * np.pi * r1),self.vround).astype(self.dtype)
 
     def check_interface(self,model):
@@ -25,15 +39,40 @@ class CosineFold:
             if diff.min() < 0:
                 model.interface[i] -= diff.min()
 
-    def generate(self, model):
+    def sample(self, model):
         nx,ny = model.shape
-        fold = self._gen_cosine(nx,ny)
+        ncosines = 1 if self.uniform else 1 + max(model.nlayers - self.first, 0)
+        return dict(shape=model.shape, cosines=[self._gen_cosine(nx,ny) for i in range(ncosines)])
+
+    def apply(self, model, params):
+        sx, sy = model.scale(params)
+        cosines = params['cosines']
+        for a1,h1,r1 in cosines:
+            model.add_history('fold_params',(a1,h1))
         for i in range(self.first, model.nlayers):
-            model.interface[i] += fold
-            if not self.uniform:
-                fold = self._gen_cosine(nx,ny)
+            a1,h1,r1 = cosines[0 if self.uniform else i-self.first]
+            model.interface[i] += self._cosine(a1,h1,r1,sx,sy)
         self.check_interface(model)
         model.set_interface(model.interface.astype(self.dtype))
         return model
 
+    def generate(self, model):
+        return self.apply(model, model.record(self, self.sample(model)))
+
+    def check_interface_batch(self,batch):
+        batch.interface[batch.interface < 0] = 0
+        for i in range(batch.nlayers):
+            diff = batch.interface[:,i+1] - batch.interface[:,i]
+            batch.interface[:,i] -= np.minimum(diff.min(axis=1), 0)[:,None]
+
+    def generate_batch(self, batch):
+        nx,ny = batch.shape
+        fold = self._gen_cosine_batch(batch.n,nx,ny)
+        for i in range(self.first, batch.nlayers):
+            batch.interface[:,i] += fold
+            if not self.uniform:
+                fold = self._gen_cosine_batch(batch.n,nx,ny)
+        self.check_interface_batch(batch)
+        batch.set_interface(batch.interface.astype(self.dtype))
+        return batch
 
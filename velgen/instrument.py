@@ -0,0 +1,95 @@
+import time
+import tracemalloc
+from collections import OrderedDict
+
+
+def step_name(step):
+    return 'generate' if step is None else type(step).__name__
+
+
+class StepProfiler:
+    def __init__(self, trace_memory=True, before=None, after=None):
+        self.trace_memory = trace_memory
+        self.before_callback = before
+        self.after_callback = after
+        self.records = []
+        self.sample = -1
+        self._started_tracing = False
+        self._t0 = 0.
+        self._mem0 = 0
+
+    def start(self, pipeline, model):
+        self.sample += 1
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def before(self, pipeline, index, step, model):
+        if self.before_callback is not None:
+            self.before_callback(index, step, model)
+        random = getattr(step, 'random', None)
+        if random is not None:
+            random.count = 0
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            self._mem0 = tracemalloc.get_traced_memory()[0]
+        self._t0 = time.perf_counter()
+
+    def after(self, pipeline, index, step, model):
+        elapsed = time.perf_counter() - self._t0
+        record = OrderedDict(sample=self.sample, index=index, step=step_name(step), time=elapsed)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record['alloc_bytes'] = current - self._mem0
+            record['peak_bytes'] = peak - self._mem0
+        random = getattr(step, 'random', None)
+        record['rng_count'] = getattr(random, 'count', 0) if random is not None else 0
+        self.records.append(record)
+        if self.after_callback is not None:
+            self.after_callback(index, step, model, record)
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def clear(self):
+        self.records = []
+        self.sample = -1
+
+    def to_records(self):
+        return [dict(r) for r in self.records]
+
+    def summary(self):
+        # per pipeline position: number of runs, total/mean time, mean allocation and peak
+        rows = OrderedDict()
+        for r in self.records:
+            key = (r['index'], r['step'])
+            row = rows.setdefault(key, dict(index=r['index'], step=r['step'], count=0, time=0.,
+                    alloc_bytes=0, peak_bytes=0, rng_count=0))
+            row['count'] += 1
+            row['time'] += r['time']
+            row['alloc_bytes'] += r.get('alloc_bytes', 0)
+            row['peak_bytes'] = max(row['peak_bytes'], r.get('peak_bytes', 0))
+            row['rng_count'] += r['rng_count']
+        total = sum(row['time'] for row in rows.values()) or 1.
+        for row in rows.values():
+            row['mean_time'] = row['time'] / row['count']
+            row['mean_alloc_bytes'] = row['alloc_bytes'] / row['count']
+            row['fraction'] = row['time'] / total
+        return sorted(rows.values(), key=lambda row: (row['index'], row['step']))
+
+    def table(self):
+        lines = ['%3s %-20s %6s %10s %10s %7s %12s %12s %8s'%('#', 'step', 'runs', 'total ms', 'mean ms', '%',
+                'mean alloc', 'max peak', 'rng')]
+        for row in self.summary():
+            lines.append('%3d %-20s %6d %10.3f %10.3f %6.1f%% %12d %12d %8d'%(row['index'], row['step'], row['count'],
+                row['time']*1e3, row['mean_time']*1e3, row['fraction']*100,
+                row['mean_alloc_bytes'], row['peak_bytes'], row['rng_count']))
+        return '\n'.join(lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+from .fill import fill_layers, slice_bounds, velocity_functions
+from .workspace import scratch
+
+
+# NumPy reference kernels. Every backend provides the same names and signatures
+# and must give bit-identical results.
+
+def fault_shift(vel, fault_line, hshift, vshift, ws=None):
+    # cells left of the fault line take the value hshift columns left and vshift rows up;
+    # the shifted block is built from row gathers and column slices, edges replicated
+    nx, ny = vel.shape
+    xmax = min(int(fault_line.max()), nx)
+    if xmax <= 0:
+        return vel
+    src_x = np.clip(np.arange(xmax) - hshift, 0, nx-1)
+    rows = np.take(vel, src_x, axis=0, out=scratch(ws, 'fault_rows', (nx, ny), vel.dtype)[:xmax], mode='clip')
+    moved = scratch(ws, 'fault_moved', (nx, ny), vel.dtype)[:xmax]
+    v = min(max(int(vshift), -ny), ny)
+    if v >= 0:
+        moved[:,v:] = rows[:,:ny-v]
+        moved[:,:v] = rows[:,:1]
+    else:
+        moved[:,:ny+v] = rows[:,-v:]
+        moved[:,ny+v:] = rows[:,-1:]
+    mask = np.less(np.arange(xmax)[:,None], fault_line[None,:], out=scratch(ws, 'fault_mask', (nx, ny), bool)[:xmax])
+    np.copyto(vel[:xmax], moved, where=mask)
+    return vel
+
+
+def fill_above(vel, bottom, value, ws=None):
+    # vel[ix,:bottom[ix]] = value for every column
+    nx, ny = vel.shape
+    bottom = slice_bounds(np.asarray(bottom), ny)
+    mask = np.less(np.arange(ny)[None,:], bottom[:,None], out=scratch(ws, 'mask', (nx, ny), bool))
+    np.copyto(vel, value, where=mask, casting='unsafe')
+    return vel
+
+
+def fill_below(vel, tops, values, ws=None):
+    # vel[ix,tops[k,ix]:] = values[k] for k in order, later bodies on top
+    nx, ny = vel.shape
+    tops = slice_bounds(np.atleast_2d(tops).astype(np.int64), ny)
+    marker = scratch(ws, 'marker', (nx, ny+1), np.int32)
+    marker[...] = -1
+    np.maximum.at(marker, (np.arange(nx), tops), np.arange(len(tops), dtype=np.int32)[:,None])
+    label = np.maximum.accumulate(marker[:,:ny], axis=1, out=scratch(ws, 'label', (nx, ny), np.int32))
+    below = np.greater_equal(label, 0, out=scratch(ws, 'mask', (nx, ny), bool))
+    index = scratch(ws, 'index', (nx, ny), np.intp)
+    np.maximum(label, 0, out=index)
+    values = np.broadcast_to(np.atleast_1d(values), len(tops)).astype(vel.dtype)
+    np.copyto(vel, np.take(values, index, out=scratch(ws, 'values', (nx, ny), vel.dtype), mode='clip'), where=below)
+    return vel
+
+
+numpy_kernels = {
+    'fill_layers': fill_layers,
+    'fault_shift': fault_shift,
+    'fill_above': fill_above,
+    'fill_below': fill_below,
+}
+
+
+def load_numba():
+    try:
+        from .numba_kernels import numba_kernels
+    except ImportError:
+        return None
+    return numba_kernels
+
+
+backends = {'numpy': numpy_kernels}
+# optional backends, imported on first use
+loaders = {'numba': load_numba}
+
+backend = 'numpy'
+
+
+def register_backend(name, kernels):
+    missing = set(numpy_kernels) - set(kernels)
+    if missing:
+        raise ValueError("Backend %s is missing kernels: %s"%(name, sorted(missing)))
+    backends[name] = kernels
+
+
+def use_backend(name):
+    # an unavailable backend (numba not installed) falls back to numpy
+    global backend
+    if name not in backends and name in loaders:
+        kernels = loaders.pop(name)()
+        if kernels is not None:
+            register_backend(name, kernels)
+    backend = name if name in backends else 'numpy'
+    return backend
+
+
+def kernel(name):
+    return backends[backend][name]
+
+
+use_backend(os.environ.get('VELGEN_BACKEND', 'numpy'))
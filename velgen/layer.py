@@ -1,5 +1,6 @@
 import numpy as np
-from .model import Random
+from .model import Random, mask_bits
+from .edits import ColumnFill
 
 
 class FlatLayer:
@@ -10,19 +11,44 @@ class FlatLayer:
         self.y_range = np.array(y_range)
         self.depth = depth
 
-    def generate(self, model):
+    def sample(self, model):
         nx, ny = model.shape
         ninterf = model.nlayers - 1
         iminsplit = int(ny * self.minsplit)
         iy_range = (ny * self.y_range).astype(np.int32)
 
         depth = self.depth or self.random.array_interval(*iy_range,ninterf,iminsplit, prepend=0,append=ny)
-                
+        return dict(shape=model.shape, depth=np.asarray(depth))
+
+    def apply(self, model, params):
+        nx, ny = model.shape
+        sx, sy = model.scale(params)
+        depth = params['depth'] * sy
+
         interface = np.repeat(depth, nx)
         model.set_interface(np.reshape(interface, (len(depth), nx)).astype(np.int32))
         model.add_history('flat_depth',depth)
         return model
 
+    def generate(self, model):
+        return self.apply(model, model.record(self, self.sample(model)))
+
+    def generate_batch(self, batch):
+        nx, ny = batch.shape
+        ninterf = batch.nlayers - 1
+        iminsplit = int(ny * self.minsplit)
+        iy_range = (ny * self.y_range).astype(np.int32)
+
+        if self.depth is not None:
+            depth = np.tile(np.asarray(self.depth), (batch.n,1))
+        else:
+            depth = self.random.array_interval_batch(batch.n,*iy_range,ninterf,iminsplit, prepend=0,append=ny)
+
+        interface = np.repeat(depth[:,:,None], nx, axis=2)
+        batch.set_interface(interface.astype(np.int32))
+        batch.add_history('flat_depth',depth)
+        return batch
+
 
 class DippingLayer:
     def __init__(self, y_range=(0.1,0.9),minsplit=0.05, left=None, right=None,random_seed=None, vround=4):
@@ -33,7 +59,7 @@ class DippingLayer:
         self.left = left
         self.right = right
 
-    def generate(self, model):
+    def sample(self, model):
         nx, ny = model.shape
         ninterf = model.nlayers - 1
         iminsplit = int(ny * self.minsplit)
@@ -41,6 +67,13 @@ class DippingLayer:
 
         left  = self.left  or self.random.array_interval(*iy_range,ninterf,iminsplit, prepend=0,append=ny)
         right = self.right or self.random.array_interval(*iy_range,ninterf,iminsplit, prepend=0,append=ny)
+        return dict(shape=model.shape, left=np.asarray(left), right=np.asarray(right))
+
+    def apply(self, model, params):
+        nx, ny = model.shape
+        sx, sy = model.scale(params)
+        left = params['left'] * sy
+        right = params['right'] * sy
 
         nb = len(left)
         interface = np.zeros((nb, nx),dtype=np.int32)
@@ -51,6 +84,30 @@ class DippingLayer:
         model.add_history('dip_right',right)
         return model
 
+    def generate(self, model):
+        return self.apply(model, model.record(self, self.sample(model)))
+
+    def generate_batch(self, batch):
+        nx, ny = batch.shape
+        ninterf = batch.nlayers - 1
+        iminsplit = int(ny * self.minsplit)
+        iy_range = (ny * self.y_range).astype(np.int32)
+
+        if self.left is not None:
+            left = np.tile(np.asarray(self.left), (batch.n,1))
+        else:
+            left = self.random.array_interval_batch(batch.n,*iy_range,ninterf,iminsplit, prepend=0,append=ny)
+        if self.right is not None:
+            right = np.tile(np.asarray(self.right), (batch.n,1))
+        else:
+            right = self.random.array_interval_batch(batch.n,*iy_range,ninterf,iminsplit, prepend=0,append=ny)
+
+        interface = np.linspace(left,right,nx,axis=-1)
+        batch.set_interface(interface.astype(np.int32))
+        batch.add_history('dip_left', left)
+        batch.add_history('dip_right',right)
+        return batch
+
 
 class LinearWaterLayer:
     def __init__(self, y_range=(0.1,0.4),vwater=1.5, left=None, right=None, random_seed=None, vround=4):
@@ -61,19 +118,43 @@ class LinearWaterLayer:
         self.left = left
         self.right = right
 
-    def generate(self, model):
+    def sample(self, model):
         nx, ny = model.shape
         iy_range = (ny * self.y_range)
 
         left  = self.left or self.random.uniform(*iy_range)
         right = self.right or self.random.uniform(*iy_range)
+        return dict(shape=model.shape, left=left, right=right)
+
+    def apply(self, model, params):
+        nx, ny = model.shape
+        sx, sy = model.scale(params)
+        left = params['left'] * sy
+        right = params['right'] * sy
         waterbottom = np.linspace(left,right,nx,dtype=np.int32)
 
-        vel = model.generate()
-        for ix in range(nx):
-            vel[ix,:waterbottom[ix]] = self.vwater
-        model.set_velocity(vel)
+        water = model.add_label('water', self.vwater)
+        model.edit(ColumnFill('fill_above', waterbottom, self.vwater, water, model.workspace, mask_bits['water']))
         model.add_history('water_bottom',waterbottom)
+        model.add_history('water_depth',(left,right))
         return model
 
+    def generate(self, model):
+        return self.apply(model, model.record(self, self.sample(model)))
+
+    def generate_batch(self, batch):
+        nx, ny = batch.shape
+        iy_range = (ny * self.y_range)
+
+        left  = np.full(batch.n, self.left)  if self.left  else self.random.uniform(*iy_range, size=batch.n)
+        right = np.full(batch.n, self.right) if self.right else self.random.uniform(*iy_range, size=batch.n)
+        waterbottom = np.linspace(left,right,nx,axis=-1,dtype=np.int32)
+
+        vel = batch.generate()
+        water = np.arange(ny)[None,None,:] < waterbottom[:,:,None]
+        np.copyto(vel, np.float32(self.vwater), where=water)
+        batch.add_history('water_bottom',waterbottom)
+        batch.add_history('water_depth',zip(left,right))
+        return batch
+
 
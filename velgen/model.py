@@ -1,11 +1,39 @@
 import numpy as np
 import sys
-from collections import defaultdict
+import copy
+import pickle
+import hashlib
+from collections import defaultdict, OrderedDict
+from .fill import velocity_functions, covers_grid, mask_bits
+from .kernels import kernel
+from .products import derive
+from .deform import warp
 
 def errexit(msg):
     print(msg)
     sys.exit(1)
 
+def seed_sequence(random_seed):
+    if isinstance(random_seed, np.random.SeedSequence):
+        return random_seed
+    if isinstance(random_seed, dict):
+        return np.random.SeedSequence(random_seed['entropy'], spawn_key=tuple(random_seed['spawn_key']),
+                                     pool_size=random_seed.get('pool_size', 4))
+    return np.random.SeedSequence(random_seed)
+
+
+def seed_json(random_seed):
+    # json form of a seed (SeedSequence included) that seed_sequence turns back into it
+    root = seed_sequence(random_seed)
+    entropy = int(root.entropy) if np.ndim(root.entropy) == 0 else [int(e) for e in root.entropy]
+    return {'entropy': entropy, 'spawn_key': [int(k) for k in root.spawn_key], 'pool_size': root.pool_size}
+
+
+def sample_seed(root, i):
+    # the i-th child of root, identical to root.spawn(n)[i] for a fresh root; unlike spawn,
+    # root is not changed, so the same SeedSequence always gives the same children
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key+(i,), pool_size=root.pool_size)
+
 
 class Random:
     def __init__(self, random_seed=None, vround=4):
@@ -29,16 +57,43 @@ class Random:
             arr = np.append(arr, append)
         return self.round(arr).astype(dtype)
 
+    def _grid(self, val, up):
+        # value in units of 10**-vround, rounded inwards
+        val = np.round(val * 10.**self.vround, 6)
+        return np.ceil(val) if up else np.floor(val)
+
+    def spaced_array(self, low, high, shape, minsplit, prepend=None, append=None, dtype=np.float32):
+        # sorted samples with all gaps >= minsplit, drawn directly: y_i = x_i - i*minsplit are
+        # sorted uniforms on a range shrunk by (size-1)*minsplit. Work on the 10**-vround grid
+        # so that rounding never narrows a gap.
+        size = shape[-1]
+        isplit = self._grid(minsplit, True)
+        ilow, ihigh = self._grid(low, True), self._grid(high, False)
+        if prepend is not None:
+            ilow = max(ilow, self._grid(prepend, True) + isplit)
+        if append is not None:
+            ihigh = min(ihigh, self._grid(append, False) - isplit)
+        ihigh -= max(size-1, 0) * isplit
+        if ihigh < ilow:
+            errexit("Cannot draw %d values in [%s, %s] with minimum spacing %s"%(size, low, high, minsplit))
+
+        arr = np.round(self.rng.uniform(low=ilow, high=ihigh, size=shape))
+        arr.sort(axis=-1)
+        arr += np.arange(size) * isplit
+        arr /= 10.**self.vround
+        if prepend is not None:
+            arr = np.insert(arr, 0, prepend, axis=-1)
+        if append is not None:
+            arr = np.insert(arr, arr.shape[-1], append, axis=-1)
+        return self.round(arr).astype(dtype)
+
     def array_interval(self, low, high, size, minsplit, prepend=None, append=None, dtype=np.float32):
-        sort = True
-        interface = self.array(low,high,size,sort,prepend,append,dtype)
-        diff = interface[1:] - interface[:-1]
-        self.count=1
-        while diff.min() < minsplit:
-            interface = self.array(low,high,size,sort,prepend,append,dtype)
-            diff = interface[1:] - interface[:-1]
-            self.count += 1
-        return interface
+        self.count = 1
+        return self.spaced_array(low, high, (size,), minsplit, prepend, append, dtype)
+
+    def array_interval_batch(self, n, low, high, size, minsplit, prepend=None, append=None, dtype=np.float32):
+        self.count = 1
+        return self.spaced_array(low, high, (n,size), minsplit, prepend, append, dtype)
 
     def perturb(self, arr, max_pert, fix_top=False, fix_bottom=False):
         arr_copy = arr.copy()
@@ -51,7 +106,7 @@ class Random:
 
 
 class Model:
-    def __init__(self, shape, velseed, max_pert=0.1, random_seed=None, vround=4):
+    def __init__(self, shape, velseed, max_pert=0.1, random_seed=None, vround=4, veltype=None, labels=False, workspace=None, masks=False):
         self.random = Random(random_seed, vround)
         self.max_pert = max_pert
         self.shape = shape
@@ -62,25 +117,90 @@ class Model:
             self.veltype = 'constant'
         elif self.velseed.ndim == 2:
             self.veltype = 'linear'
+        if veltype is not None:
+            self.veltype = veltype
         self.nlayers = len(self.velseed)
-        self.velocity = np.zeros(self.shape, dtype=np.float32)
+        # optional Workspace: the velocity and every full-grid temporary live in reused buffers
+        self.workspace = workspace
+        # the velocity, label and mask grids are allocated on first use, so a deferred model
+        # rendered in tiles never holds a full-size grid
+        self._velocity = None
         self.filled = False
+        self.deferred = False
+        self.edits = []
         self.history=defaultdict(list)
+        # optional per-cell label grid: layer index, then ids from add_label (salt, water)
+        self._labels = None
+        self.labels_dtype = None
+        if labels:
+            self.labels_dtype = np.dtype(np.uint8 if self.nlayers < 192 else np.uint16)
+        self.label_table = None
+        self.label_ids = {}
+        # optional segmentation grid of mask_bits: fault zones, salt and water
+        self._masks = None
+        self.masks_dtype = np.dtype(np.uint8) if masks else None
+        # sampled step parameters and fill velocities, for rasterizing at other resolutions
+        self.geometry = []
+        self.fill_draws = []
+        self.replay_draws = None
+        self.replayable = True
+        # displacement fields waiting to be resampled together
+        self.warps = []
+        # running top envelope of the Gaussian salts: (tops, vsalt, label id) per run of
+        # salts with the same velocity, redrawn after every refill
+        self.salt_envelope = []
+        # a sub-pixel field was resampled (bilinearly) since the last fill of the whole grid,
+        # so the velocity holds values outside the per-label table
+        self.interpolated = False
+
+    @property
+    def velocity(self):
+        if self._velocity is None:
+            if self.workspace is not None:
+                self._velocity = self.workspace.zeros('velocity', self.shape)
+            else:
+                self._velocity = np.zeros(self.shape, dtype=np.float32)
+        return self._velocity
+
+    @velocity.setter
+    def velocity(self, vel):
+        self._velocity = vel
+
+    @property
+    def labels(self):
+        # None if labels are not tracked; upgraded in place of the old grid when add_label
+        # runs out of uint8 ids
+        if self.labels_dtype is not None:
+            if self._labels is None:
+                self._labels = np.zeros(self.shape, dtype=self.labels_dtype)
+            elif self._labels.dtype != self.labels_dtype:
+                self._labels = self._labels.astype(self.labels_dtype)
+        return self._labels
+
+    @labels.setter
+    def labels(self, labels):
+        self._labels = labels
+        self.labels_dtype = None if labels is None else labels.dtype
+
+    @property
+    def masks(self):
+        if self.masks_dtype is not None and self._masks is None:
+            self._masks = np.zeros(self.shape, dtype=self.masks_dtype)
+        return self._masks
+
+    @masks.setter
+    def masks(self, masks):
+        self._masks = masks
+        self.masks_dtype = None if masks is None else masks.dtype
 
     def fill_const_velocity(self,velseed):
-        for ix in range(self.nx):
-            for i in range(self.nlayers):
-                iy0 = self.interface[i,ix]
-                iy1 = self.interface[i+1,ix]
-                self.velocity[ix,iy0:iy1] = velseed[i]
+        kernel('fill_layers')(self.velocity, self.interface, velseed, velocity_functions['constant'], self.labels, ws=self.workspace, masks=self.masks)
+        self.label_table = np.asarray(velseed)
         self.filled = True
 
     def fill_vlin_velocity(self,velseed):
-        for ix in range(self.nx):
-            for i in range(self.nlayers):
-                iy0 = self.interface[i,ix]
-                iy1 = self.interface[i+1,ix]
-                self.velocity[ix,iy0:iy1] = np.linspace(velseed[i,0],velseed[i,1],iy1-iy0)
+        kernel('fill_layers')(self.velocity, self.interface, velseed, velocity_functions['linear'], self.labels, ws=self.workspace, masks=self.masks)
+        self.label_table = np.asarray(velseed)
         self.filled = True
 
     def fill_velocity(self, velseed):
@@ -88,10 +208,20 @@ class Model:
             self.fill_const_velocity(velseed)
         elif self.veltype == 'vlinear' or self.veltype == 'linear':
             self.fill_vlin_velocity(velseed)
+        elif self.veltype in velocity_functions:
+            kernel('fill_layers')(self.velocity, self.interface, velseed, velocity_functions[self.veltype], self.labels, ws=self.workspace, masks=self.masks)
+            self.label_table = np.asarray(velseed)
+            self.filled = True
+        else:
+            errexit("Unknown velocity type: %s"%self.veltype)
 
     def set_velocity(self, vel):
         if self.shape == vel.shape:
-            self.velocity = vel
+            if self.deferred:
+                self.edits.append(('set', vel))
+            else:
+                self.warps = []
+                self.velocity = vel
             self.filled = True
         else:
             errexit("Wrong velocity shape: expected %s, got %s"%(self.shape, vel.shape))
@@ -106,26 +236,358 @@ class Model:
     def add_history(self, key, val):
         self.history[key].append(val)
 
+    def add_label(self, name, vel):
+        # id of a constant-velocity body (salt, water); the same name and velocity share an id
+        if self.labels_dtype is None:
+            return None
+        key = (name, float(vel))
+        if key not in self.label_ids:
+            self.label_ids[key] = self.nlayers + len(self.label_ids)
+            if self.label_ids[key] > np.iinfo(self.labels_dtype).max:
+                self.labels_dtype = np.dtype(np.uint16)
+        return self.label_ids[key]
+
+    def label_names(self):
+        names = ['layer%d'%i for i in range(self.nlayers)]
+        return names + [name for name, vel in sorted(self.label_ids, key=self.label_ids.get)]
+
+    def segmentation(self):
+        # per-cell channels written in the generation pass: the layer index (salt and water
+        # cells hold their add_label ids) and one boolean mask per bit of the mask grid
+        if self.labels is None or self.masks is None:
+            errexit("Segmentation needs a model created with labels=True and masks=True")
+        self.generate()
+        out = {'layer': self.labels}
+        for name, bit in mask_bits.items():
+            out[name] = (self.masks & bit) != 0
+        return out
+
+    def compact(self):
+        if self.labels is None:
+            errexit("Label tracking is off: create the model with labels=True")
+        if self.veltype != 'constant':
+            errexit("Compact models need constant layer velocities, got %s"%self.veltype)
+        self.generate()
+        if self.interpolated:
+            errexit("Compact models cannot hold the interpolated velocities of sub-pixel faults")
+        table = np.zeros(self.nlayers + len(self.label_ids), dtype=np.float32)
+        table[:self.nlayers] = self.label_table
+        for (name, vel), i in self.label_ids.items():
+            table[i] = vel
+        return CompactModel(self.labels.copy(), table, self.label_names())
+
     def get_history(self, key, idx=-1):
         return self.history[key][idx]
 
     def clear_history(self):
         self.history=defaultdict(list)
         self.filled=False
+        self.edits=[]
+        self.label_ids={}
+        self.geometry=[]
+        self.fill_draws=[]
+        self.replayable=True
+        self.warps=[]
+        self.salt_envelope=[]
+        self.interpolated=False
 
-    def generate(self,force_fill=False):
+    def reset(self, velseed=None, random=None):
+        # start a new sample in the same buffers
+        if velseed is not None:
+            self.velseed = np.array(velseed)
+            self.nlayers = len(self.velseed)
+        if random is not None:
+            self.random = random
+        self.interface = None
+        if self._velocity is not None:
+            self._velocity[...] = 0
+        if self.labels_dtype is not None and self.nlayers >= 192:
+            self.labels_dtype = np.dtype(np.uint16)
+        if self._labels is not None:
+            if self._labels.dtype == self.labels_dtype:
+                self._labels[...] = 0
+            else:
+                self._labels = None
+        if self._masks is not None:
+            self._masks[...] = 0
+        self.clear_history()
+        return self
+
+    def snapshot(self):
+        # the state between steps; restore() gives a model that continues from here. The
+        # velocity is copied: it may be a workspace buffer that other models overwrite
+        self.flush()
+        return dict(
+            velseed=self.velseed.copy(),
+            interface=None if self.interface is None else self.interface.copy(),
+            velocity=None if self._velocity is None else self._velocity.copy(), filled=self.filled, edits=list(self.edits),
+            history={k: list(v) for k,v in self.history.items()},
+            labels=None if self.labels is None else self.labels.copy(),
+            masks=None if self.masks is None else self.masks.copy(),
+            label_table=self.label_table, label_ids=dict(self.label_ids),
+            geometry=list(self.geometry), fill_draws=list(self.fill_draws), replayable=self.replayable,
+            salt_envelope=list(self.salt_envelope), interpolated=self.interpolated)
+
+    def restore(self, state):
+        # the velocity is copied only if a fill or edit already wrote to it
+        self.velseed = state['velseed'].copy()
+        self.interface = None if state['interface'] is None else state['interface'].copy()
+        self.filled = state['filled']
+        if self.filled and not self.deferred and state['velocity'] is not None:
+            self.velocity = state['velocity'].copy()
+        else:
+            self.velocity = np.zeros(self.shape, dtype=np.float32)
+        self.edits = list(state['edits'])
+        self.history = defaultdict(list, {k: list(v) for k,v in state['history'].items()})
+        self.labels = None if state['labels'] is None else state['labels'].copy()
+        self.masks = None if state['masks'] is None else state['masks'].copy()
+        self.label_table = state['label_table']
+        self.label_ids = dict(state['label_ids'])
+        self.geometry = list(state['geometry'])
+        self.fill_draws = list(state['fill_draws'])
+        self.replayable = state['replayable']
+        self.warps = []
+        self.salt_envelope = list(state['salt_envelope'])
+        self.interpolated = state['interpolated']
+        return self
+
+    def record(self, step, params):
+        self.geometry.append((step, params))
+        return params
+
+    def scale(self, params):
+        # factors from the grid the parameters were sampled on to this grid
+        nx, ny = params['shape']
+        return self.nx / nx, self.ny / ny
+
+    def fill(self, force_fill=False):
         if force_fill:
             self.filled=False
         if not self.filled:
-            velseed = self.random.perturb(self.velseed, self.max_pert, fix_top=True)
-            self.fill_velocity(velseed)
+            self.flush()
+            if self.replay_draws is not None:
+                velseed = self.replay_draws.pop(0)
+            else:
+                velseed = self.random.perturb(self.velseed, self.max_pert, fix_top=True)
+                self.fill_draws.append(velseed)
+            if covers_grid(self.interface, self.ny):
+                self.interpolated = False
+            if self.deferred:
+                self.edits.append(('fill', velseed, self.interface.copy()))
+                self.filled = True
+            else:
+                self.fill_velocity(velseed)
+
+    def edit(self, op):
+        # op(vel, labels, masks) modifies the velocity (and labels and masks, if tracked)
+        # in place; deferred models only record it
+        self.flush()
+        self.fill()
+        if self.deferred:
+            self.edits.append(('edit', op))
+        else:
+            op(self.velocity, self.labels, self.masks)
+
+    def warp(self, field):
+        # displacement fields (deform.FaultField) are composed and resampled once,
+        # when the velocity is next edited, refilled or returned
+        self.fill()
+        if field.subpixel:
+            self.interpolated = True
+        if self.deferred:
+            if self.edits and self.edits[-1][0] == 'warp':
+                self.edits[-1] = ('warp', self.edits[-1][1] + [field])
+            else:
+                self.edits.append(('warp', [field]))
+        else:
+            self.warps.append(field)
+
+    def flush(self):
+        if self.warps:
+            fields, self.warps = self.warps, []
+            warp(self.velocity, self.labels, fields, self.workspace, masks=self.masks)
+
+    def replay_edits(self):
+        # the recorded edits from the last one that overwrites the whole grid
+        start = 0
+        for i, e in enumerate(self.edits):
+            if e[0] == 'set' or (e[0] == 'fill' and covers_grid(e[2], self.ny)):
+                start = i
+        return self.edits[start:]
+
+    def render(self):
+        edits, self.edits = self.replay_edits(), []
+        for e in edits:
+            if e[0] == 'fill':
+                interface, self.interface = self.interface, e[2]
+                self.fill_velocity(e[1])
+                self.interface = interface
+            elif e[0] == 'set':
+                self.velocity = e[1]
+            elif e[0] == 'warp':
+                warp(self.velocity, self.labels, e[1], self.workspace, masks=self.masks)
+            else:
+                e[1](self.velocity, self.labels, self.masks)
+        return self.velocity
+
+    def generate(self,force_fill=False):
+        self.fill(force_fill)
+        if self.deferred:
+            return self.render()
+        self.flush()
+        return self.velocity
+
+
+class CompactModel:
+    # label grid plus a per-label velocity table; the dense grid is built on request
+    def __init__(self, labels, table, names=None):
+        self.labels = labels
+        self.table = table
+        self.names = names
+        self.shape = labels.shape
+
+    @property
+    def nbytes(self):
+        return self.labels.nbytes + self.table.nbytes
+
+    def to_dense(self, out=None):
+        return np.take(self.table, self.labels, out=out)
+
+    def __array__(self, dtype=None, copy=None):
+        vel = self.to_dense()
+        return vel if dtype is None else vel.astype(dtype)
+
+
+class ModelBatch:
+    def __init__(self, model, n):
+        self.model = model
+        self.n = n
+        self.random = model.random
+        self.max_pert = model.max_pert
+        self.shape = model.shape
+        self.nx, self.ny = model.shape
+        self.velseed = model.velseed
+        self.veltype = model.veltype
+        self.nlayers = model.nlayers
+        self.interface = None
+        self.velocity = np.zeros((n,)+tuple(self.shape), dtype=np.float32)
+        self.filled = np.zeros(n, dtype=bool)
+        self.history = [defaultdict(list) for _ in range(n)]
+        self.salt_envelopes = [[] for _ in range(n)]
+
+    def set_interface(self, interface):
+        interface_shape = (self.n, self.nlayers+1, self.nx)
+        if interface.shape == interface_shape:
+            self.interface = interface
+        else:
+            errexit("Wrong interface shape: expected %s, got %s"%(interface_shape, interface.shape))
+
+    def add_history(self, key, vals):
+        for history, val in zip(self.history, vals):
+            history[key].append(val)
+
+    def sample(self, k):
+        m = copy.copy(self.model)
+        m.velseed = self.velseed.copy()
+        m.deferred = False
+        m.edits = []
+        m.labels = None
+        m.masks = None
+        m.geometry = []
+        m.fill_draws = []
+        m.warps = []
+        # batch steps draw for all samples at once and keep no per-sample parameters
+        m.replayable = False
+        m.interface = None if self.interface is None else self.interface[k].copy()
+        m.velocity = self.velocity[k]
+        m.filled = bool(self.filled[k])
+        m.history = self.history[k]
+        m.salt_envelope = self.salt_envelopes[k]
+        return m
+
+    def update(self, k, m):
+        m.flush()
+        if m.interface is not None:
+            if self.interface is None:
+                self.interface = np.zeros((self.n, self.nlayers+1, self.nx), dtype=np.int32)
+            self.interface[k] = m.interface
+        if not np.shares_memory(m.velocity, self.velocity[k]):
+            self.velocity[k] = m.velocity
+        self.filled[k] = m.filled
+
+    def apply(self, step):
+        # per-sample fallback for steps without generate_batch
+        for k in range(self.n):
+            self.update(k, step.generate(self.sample(k)))
+        return self
+
+    def generate(self, force_fill=False):
+        if force_fill:
+            self.filled[:] = False
+        idx = np.flatnonzero(~self.filled)
+        if len(idx):
+            # one draw for all samples; layers first so fix_top keeps the top layer
+            velseed = np.repeat(self.velseed[:,None].astype(np.float64), len(idx), axis=1)
+            velseed = np.moveaxis(self.random.perturb(velseed, self.max_pert, fix_top=True), 1, 0)
+            func = velocity_functions[self.veltype]
+            for j,k in enumerate(idx):
+                kernel('fill_layers')(self.velocity[k], self.interface[k], velseed[j], func, ws=self.model.workspace)
+            self.filled[idx] = True
         return self.velocity
 
 
+prefix_cache = OrderedDict()
+prefix_cache_size = 16
+
+
+def prefix_key(model, steps, seed, deferred):
+    params = [(type(step).__name__, {k:v for k,v in sorted(vars(step).items()) if k != 'random'})
+              for step in steps]
+    spec = (model.shape, model.velseed, model.max_pert, model.random.vround, model.veltype,
+            model.labels_dtype is not None, model.masks_dtype is not None, deferred, params, seed.entropy, seed.spawn_key)
+    return hashlib.sha1(pickle.dumps(spec)).hexdigest()
+
+
 class Pipeline:
-    def __init__(self, steps, model=None):
+    def __init__(self, steps, model=None, deferred=False, hooks=None, products=None):
         self.steps = steps
         self.model = model
+        self.deferred = deferred
+        self.hooks = list(hooks or [])
+        # derived products (smoothed model, slowness, density) computed by generate_products
+        self.products = list(products or [])
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def _run_steps(self, m, steps, start=0, run_step=None):
+        # the step loop of every generation path: hooks see each step at its index in the
+        # pipeline, and steps that cannot be replayed mark the model
+        for i, step in enumerate(steps, start):
+            for hook in self.hooks:
+                hook.before(self, i, step, m)
+            if not hasattr(step, 'apply'):
+                m.replayable = False
+            m = step.generate(m) if run_step is None else run_step(step, m)
+            for hook in self.hooks:
+                hook.after(self, i, step, m)
+        return m
+
+    def _finish(self, m, index, finish):
+        # hooks see the final fill or render as step None
+        for hook in self.hooks:
+            hook.before(self, index, None, m)
+        vel = finish(m)
+        for hook in self.hooks:
+            hook.after(self, index, None, m)
+        return vel
+
+    def _run(self, m, finish, run_step=None):
+        for hook in self.hooks:
+            hook.start(self, m)
+        m = self._run_steps(m, self.steps, run_step=run_step)
+        return self._finish(m, len(self.steps), finish)
 
     def generate(self, model=None, clear=True):
         m = model or self.model
@@ -133,9 +595,128 @@ class Pipeline:
             errexit("A model is required")
         if clear:
             m.clear_history()
-        for step in self.steps:
-            m = step.generate(m)
-        return m.generate()
+        # deferred: steps record fills and velocity edits, rendered once at the end
+        deferred, m.deferred = m.deferred, self.deferred
+        try:
+            return self._run(m, lambda m: m.generate())
+        finally:
+            m.deferred = deferred
+
+    def generate_tiled(self, path=None, tile=1024, workers=1, model=None, labels_path=None, masks_path=None):
+        # the steps sample the geometry once for the whole grid, then the velocity is rendered
+        # tile by tile into the .npy at path (in memory without a path); see tile.render_tiles
+        from .tile import open_output, render_tiles
+        m = model or self.model
+        if m is None:
+            errexit("A model is required")
+        m.clear_history()
+        out = open_output(path, m.shape, np.float32)
+        labels = None
+        if labels_path is not None:
+            if m.labels_dtype is None:
+                errexit("The model does not track labels")
+            labels = open_output(labels_path, m.shape, m.labels_dtype)
+        masks = None
+        if masks_path is not None:
+            if m.masks_dtype is None:
+                errexit("The model does not track masks")
+            masks = open_output(masks_path, m.shape, np.uint8)
+
+        def finish(m):
+            m.fill()
+            return render_tiles(m, out, tile, workers, labels, masks)
+
+        deferred, m.deferred = m.deferred, True
+        try:
+            return self._run(m, finish)
+        finally:
+            m.deferred = deferred
+            if path is not None:
+                out.flush()
+            if labels is not None:
+                labels.flush()
+            if masks is not None:
+                masks.flush()
+
+    def generate_products(self, model=None, n=None):
+        # the velocity and its products in the same pass; n > 0 generates a batch
+        vel = self.generate(model) if n is None else self.generate_batch(n, model)
+        return derive(vel, self.products)
+
+    def seed(self, random_seed):
+        # spawn one independent stream per step (and for the model's perturbation)
+        root = seed_sequence(random_seed)
+        if self.model is not None:
+            self.model.random = Random(sample_seed(root, 0), self.model.random.vround)
+        for i, step in enumerate(self.steps):
+            if hasattr(step, 'random'):
+                step.random = Random(sample_seed(root, i+1), step.random.vround)
+        return self
+
+    def _seeded(self, random_seed):
+        # fresh copy per sample, so no state carries over between samples
+        pipe = copy.deepcopy(self)
+        pipe.hooks = []
+        return pipe.seed(random_seed)
+
+    def stream(self, batch_size, prefetch=2, workers=1, random_seed=None, copy=True):
+        from .dataset import stream
+        if self.model is None:
+            errexit("A model is required")
+        return stream(self._seeded, batch_size, prefetch, workers, random_seed, copy)
+
+    def fork(self, prefix_steps, suffixes, n_variants=1, model=None, random_seed=None):
+        # run the prefix once, then n_variants of every suffix from a snapshot of its state;
+        # returns vels[isuffix][ivariant]. Prefix states are cached by step parameters and seed.
+        m = model or self.model
+        if m is None:
+            errexit("A model is required")
+        prefix_steps = self.steps if prefix_steps is None else list(prefix_steps)
+        root = seed_sequence(random_seed)
+        prefix_seed, variant_seed = sample_seed(root, 0), sample_seed(root, 1)
+        velseed = m.velseed.copy()
+        deferred, m.deferred = m.deferred, self.deferred
+        try:
+            for hook in self.hooks:
+                hook.start(self, m)
+            key = prefix_key(m, prefix_steps, prefix_seed, self.deferred)
+            state = prefix_cache.get(key)
+            if state is None:
+                Pipeline(prefix_steps, m).seed(prefix_seed)
+                m.clear_history()
+                m = self._run_steps(m, prefix_steps)
+                state = m.snapshot()
+                prefix_cache[key] = state
+                while len(prefix_cache) > prefix_cache_size:
+                    prefix_cache.popitem(last=False)
+            else:
+                prefix_cache.move_to_end(key)
+
+            # hooks see the suffix steps after the prefix steps, once per variant
+            vels = []
+            for i, suffix in enumerate(suffixes):
+                suffix = list(suffix)
+                vels.append([])
+                for j in range(n_variants):
+                    seed = np.random.SeedSequence(variant_seed.entropy, spawn_key=variant_seed.spawn_key+(i,j))
+                    Pipeline(suffix, m.restore(state)).seed(seed)
+                    m = self._run_steps(m, suffix, len(prefix_steps))
+                    vels[-1].append(self._finish(m, len(prefix_steps)+len(suffix), lambda m: m.generate()))
+            return vels
+        finally:
+            m.deferred = deferred
+            m.velseed = velseed
+
+    def generate_batch(self, n, model=None):
+        m = model or self.model
+        if m is None:
+            errexit("A model is required")
+        return self._run(ModelBatch(m, n), lambda batch: batch.generate(), self._batch_step)
+
+    def _batch_step(self, step, batch):
+        if hasattr(step, 'generate_batch'):
+            return step.generate_batch(batch)
+        return batch.apply(step)
 
 
 class Identity:
@@ -145,3 +726,9 @@ class Identity:
     def generate(self, model):
         return model
 
+    def apply(self, model, params):
+        return model
+
+    def generate_batch(self, batch):
+        return batch
+
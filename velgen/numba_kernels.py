@@ -0,0 +1,120 @@
+import numba
+import numpy as np
+from .fill import fill_layers, slice_bounds, velocity_functions
+from .workspace import scratch
+
+
+# numba kernels, bit-identical to the numpy reference kernels in kernels.py. This module is
+# imported only when the backend is first selected, since compiling and loading numba is slow.
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_const(vel, bounds, table):
+    nb, nx = bounds.shape
+    for ix in numba.prange(nx):
+        for i in range(nb-1):
+            for iy in range(bounds[i,ix], bounds[i+1,ix]):
+                vel[ix,iy] = table[i]
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_vlinear(vel, bounds, velseed):
+    nb, nx = bounds.shape
+    for ix in numba.prange(nx):
+        for i in range(nb-1):
+            top, n = bounds[i,ix], bounds[i+1,ix] - bounds[i,ix]
+            v0, v1 = velseed[i,0], velseed[i,1]
+            step = (v1 - v0) / max(n-1, 1)
+            for k in range(n):
+                vel[ix,top+k] = v1 if (k == n-1 and n > 1) else k * step + v0
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_lateral(vel, bounds, velseed):
+    nb, nx = bounds.shape
+    for ix in numba.prange(nx):
+        for i in range(nb-1):
+            v = velseed[i,0] + (velseed[i,1] - velseed[i,0]) * ix / max(nx-1, 1)
+            for iy in range(bounds[i,ix], bounds[i+1,ix]):
+                vel[ix,iy] = v
+
+
+_numba_fills = {
+    velocity_functions['constant']: _fill_const,
+    velocity_functions['vlinear']: _fill_vlinear,
+    velocity_functions['lateral']: _fill_lateral,
+}
+
+
+def numba_fill_layers(vel, interface, velseed, func=velocity_functions['constant'], labels=None, ws=None, masks=None):
+    velseed = np.asarray(velseed)
+    # numba promotes float32 arithmetic differently from numpy
+    if func not in _numba_fills or (velseed.dtype != np.float64 and func is not velocity_functions['constant']):
+        return fill_layers(vel, interface, velseed, func, labels, ws, masks)
+    bounds = slice_bounds(interface, vel.shape[1]).astype(np.int64)
+    if func is velocity_functions['constant']:
+        velseed = velseed.astype(vel.dtype)
+    _numba_fills[func](vel, bounds, velseed)
+    if labels is not None:
+        _fill_const(labels, bounds, np.arange(len(bounds)-1).astype(labels.dtype))
+    if masks is not None:
+        _fill_const(masks, bounds, np.zeros(len(bounds)-1, dtype=masks.dtype))
+    return vel
+
+
+@numba.njit(parallel=True, cache=True)
+def _fault_shift(vel, src, xmax, fault_line, hshift, vshift):
+    nx, ny = vel.shape
+    for ix in numba.prange(xmax):
+        sx = min(max(ix - hshift, 0), nx-1)
+        for iy in range(ny):
+            if ix < fault_line[iy]:
+                vel[ix,iy] = src[sx, min(max(iy - vshift, 0), ny-1)]
+
+
+def numba_fault_shift(vel, fault_line, hshift, vshift, ws=None):
+    xmax = min(int(fault_line.max()), vel.shape[0])
+    if xmax <= 0:
+        return vel
+    # gather from a copy of the columns the moving block reads
+    nsrc = min(xmax + max(-int(hshift), 0), vel.shape[0])
+    src = scratch(ws, 'fault_rows', vel.shape, vel.dtype)[:nsrc]
+    src[...] = vel[:nsrc]
+    _fault_shift(vel, src, xmax, fault_line.astype(np.int64), int(hshift), int(vshift))
+    return vel
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_above(vel, bottom, value):
+    for ix in numba.prange(vel.shape[0]):
+        for iy in range(bottom[ix]):
+            vel[ix,iy] = value
+
+
+def numba_fill_above(vel, bottom, value, ws=None):
+    bottom = slice_bounds(np.asarray(bottom), vel.shape[1]).astype(np.int64)
+    _fill_above(vel, bottom, vel.dtype.type(value))
+    return vel
+
+
+@numba.njit(parallel=True, cache=True)
+def _fill_below(vel, tops, values):
+    ny = vel.shape[1]
+    for ix in numba.prange(vel.shape[0]):
+        for k in range(tops.shape[0]):
+            for iy in range(tops[k,ix], ny):
+                vel[ix,iy] = values[k]
+
+
+def numba_fill_below(vel, tops, values, ws=None):
+    tops = slice_bounds(np.atleast_2d(tops).astype(np.int64), vel.shape[1])
+    _fill_below(vel, tops, np.broadcast_to(np.atleast_1d(values), len(tops)).astype(vel.dtype))
+    return vel
+
+
+numba_kernels = {
+    'fill_layers': numba_fill_layers,
+    'fault_shift': numba_fault_shift,
+    'fill_above': numba_fill_above,
+    'fill_below': numba_fill_below,
+}
@@ -0,0 +1,153 @@
+import os
+import json
+import numpy as np
+from .model import Random, Model, Pipeline, Identity, errexit, seed_sequence
+from .layer import FlatLayer, DippingLayer, LinearWaterLayer
+from .fold import CosineFold
+from .fault import LinearFault
+from .salt import GaussianSalt, EllipticSalt
+from .workspace import Workspace
+
+
+step_types = {cls.__name__: cls for cls in [
+    Identity, FlatLayer, DippingLayer, LinearWaterLayer, CosineFold, LinearFault, GaussianSalt, EllipticSalt]}
+
+
+# the scenario mixture of util.gom_generator
+gom_spec = {
+    'shape': [256, 128],
+    'velocity': {'v0': 1.5, 'dz': 0.05, 'k_range': [0.38, 0.42], 'nlayers_range': [10, 25]},
+    # one salt velocity per sample, shared by all salt bodies
+    'draws': {'vsalt': {'uniform': [4.5,5.0]}},
+    'stages': [
+        {'name': 'layer', 'choices': [
+            {'steps': [{'type': 'FlatLayer', 'y_range': [0.1,0.9], 'minsplit': 0.01}]},
+            {'steps': [{'type': 'DippingLayer', 'y_range': [0.1,0.9], 'minsplit': 0.01}]}]},
+        {'name': 'fold', 'choices': [
+            {'steps': []},
+            {'steps': [{'type': 'CosineFold'}]}]},
+        {'name': 'salt', 'choices': [
+            {'steps': []},
+            {'steps': [{'type': 'LinearFault', 'max_nfaults': 3, 'vshift_range': [0.05,0.1]}]},
+            {'steps': [{'type': 'GaussianSalt', 'vsalt': {'draw': 'vsalt'}, 'width_range': [0.05,0.1], 'height_range': [0.4,0.6]}]},
+            {'steps': [{'type': 'GaussianSalt', 'vsalt': {'draw': 'vsalt'}, 'width_range': [0.05,0.1], 'height_range': [0.4,0.6]}], 'repeat': 2},
+            {'steps': [{'type': 'EllipticSalt', 'vsalt': {'draw': 'vsalt'}}]},
+            {'steps': [{'type': 'EllipticSalt', 'vsalt': {'draw': 'vsalt'}}], 'repeat': 2},
+            {'steps': [{'type': 'GaussianSalt', 'vsalt': {'draw': 'vsalt'}, 'width_range': [0.05,0.1], 'height_range': [0.4,0.6]},
+                       {'type': 'EllipticSalt', 'vsalt': {'draw': 'vsalt'}}]}]},
+        {'name': 'water', 'choices': [
+            {'steps': [{'type': 'LinearWaterLayer', 'vwater': 1.5, 'y_range': [0.1,0.2]}]}]},
+    ],
+}
+
+
+def make_step(spec, shared=None):
+    # {'type': name, **kwargs}; a kwarg {'uniform': [low, high]} is drawn again for every sample,
+    # a kwarg {'draw': name} takes the sample's value of the plan's shared draw of that name
+    if shared is None:
+        shared = {}
+    kwargs = dict(spec)
+    name = kwargs.pop('type')
+    if name not in step_types:
+        errexit("Unknown step type: %s"%name)
+    draws = {}
+    for k, v in kwargs.items():
+        if isinstance(v, dict) and 'uniform' in v:
+            draws[k] = tuple(v['uniform'])
+        elif isinstance(v, dict) and 'draw' in v:
+            if v['draw'] not in shared:
+                errexit("Unknown shared draw: %s"%v['draw'])
+            draws[k] = v['draw']
+    for k, d in draws.items():
+        kwargs[k] = (shared[d] if isinstance(d, str) else d)[0]
+    step = step_types[name](**kwargs)
+    for k in draws:
+        if not hasattr(step, k):
+            errexit("%s cannot redraw %s per sample"%(name, k))
+    return step, draws
+
+
+class Plan:
+    # a scenario mixture compiled once: step objects, a model and its buffers are reused,
+    # and each sample draws its branches and all step parameters from one random stream
+    def __init__(self, spec, shape=None, deferred=False):
+        self.spec = spec
+        self.shape = tuple(shape or spec['shape'])
+        self.velocity = dict(spec.get('velocity', {}))
+        if 'velseed' not in self.velocity and 'v0' not in self.velocity:
+            errexit("The plan needs a velocity: velseed, or v0 with k_range and nlayers_range")
+        self.draws = {k: tuple(v['uniform']) for k,v in spec.get('draws', {}).items()}
+        self.stages = []
+        for stage in spec['stages']:
+            choices = stage['choices']
+            weights = np.array([c.get('weight', 1.) for c in choices], dtype=np.float64)
+            if len(choices) == 0 or weights.min() < 0 or weights.sum() <= 0:
+                errexit("Stage %s needs choices with positive total weight"%stage.get('name'))
+            branches = []
+            for c in choices:
+                steps = [make_step(s, self.draws) for s in c['steps']]
+                branches.append(steps * c.get('repeat', 1))
+            self.stages.append((stage.get('name'), branches, weights / weights.sum()))
+        self.workspace = Workspace()
+        self.model = Model(self.shape, self._velseed(Random(0)), workspace=self.workspace)
+        self.pipe = Pipeline([], self.model, deferred=deferred)
+        self.branches = []
+
+    def _velseed(self, random):
+        vel = self.velocity
+        if 'velseed' in vel:
+            return np.array(vel['velseed'])
+        zmax = self.shape[1] * vel.get('dz', 1.)
+        k = random.uniform(*vel['k_range'])
+        nlayers = random.uniform(*vel['nlayers_range'], dtype=np.int32)
+        return np.linspace(vel['v0'], vel['v0'] + k * zmax, nlayers)
+
+    def select(self, random):
+        steps, self.branches = [], []
+        for name, branches, p in self.stages:
+            i = random.choice(len(branches), p=p)
+            self.branches.append(int(i))
+            steps += branches[i]
+        return steps
+
+    def generate(self, random_seed=None, copy=True):
+        # without copy, the returned array is the plan's buffer and is overwritten by the next sample
+        random = Random(seed_sequence(random_seed))
+        self.model.reset(self._velseed(random), random)
+        shared = {k: random.uniform(low, high) for k, (low, high) in self.draws.items()}
+        steps = self.select(random)
+        for step, draws in steps:
+            step.random = random
+            for k, d in draws.items():
+                setattr(step, k, shared[d] if isinstance(d, str) else random.uniform(*d))
+        self.pipe.steps = [step for step, draws in steps]
+        vel = self.pipe.generate()
+        return vel.copy() if copy else vel
+
+    def __call__(self, random_seed=None):
+        # plans are factories for generate_dataset and stream
+        return self.generate(random_seed)
+
+    @classmethod
+    def from_json(cls, path, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    @classmethod
+    def from_yaml(cls, path, **kwargs):
+        try:
+            import yaml
+        except ImportError:
+            errexit("PyYAML is required to read %s"%path)
+        with open(path) as f:
+            return cls(yaml.safe_load(f), **kwargs)
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.spec, f, indent=1)
+
+
+def load_plan(path, **kwargs):
+    if os.path.splitext(path)[1] in ('.yaml', '.yml'):
+        return Plan.from_yaml(path, **kwargs)
+    return Plan.from_json(path, **kwargs)
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+def box_radii(sigma, passes):
+    # radii of `passes` odd boxes whose cascade has the variance of a Gaussian of sigma:
+    # the narrower width for the first m passes, the next odd width for the rest
+    if sigma <= 0:
+        return [0] * passes
+    wl = int(np.sqrt(12.*sigma**2/passes + 1))
+    wl -= 1 - wl % 2
+    m = int(round((12.*sigma**2 - passes*wl**2 - 4*passes*wl - 3*passes) / (-4*wl - 4)))
+    m = min(max(m, 0), passes)
+    return [(wl-1)//2] * m + [(wl+1)//2] * (passes-m)
+
+
+def box_filter(arr, radii):
+    # cascade of running means over 2r+1 cells along axis -2, edge cells replicated; each pass
+    # is one cumulative sum, and all passes share two float64 buffers
+    radii = [r for r in radii if r > 0]
+    if not radii:
+        return arr
+    n = arr.shape[-2]
+    c = np.empty(arr.shape[:-2] + (n+2*max(radii)+1, arr.shape[-1]), dtype=np.float64)
+    out = np.empty(arr.shape, dtype=np.float64)
+    src = arr
+    for r in radii:
+        cr = c[...,:n+2*r+1,:]
+        cr[...,r+1:n+r+1,:] = src
+        cr[...,:r+1,:] = src[...,:1,:]
+        cr[...,n+r+1:,:] = src[...,-1:,:]
+        np.cumsum(cr, axis=-2, out=cr)
+        np.subtract(cr[...,2*r+1:,:], cr[...,:n,:], out=out)
+        out *= 1. / (2*r+1)
+        src = out
+    return out
+
+
+def gaussian_smooth(vel, sigma, passes=3):
+    # separable box cascade over the last two axes, so (nx,ny) and (n,nx,ny) both work;
+    # sigma in cells, one value or (sigma_x, sigma_y). Cumulative sums run along rows of
+    # contiguous arrays, so the y pass works on a transposed copy.
+    vel = np.asarray(vel)
+    sx, sy = np.broadcast_to(sigma, 2)
+    out = box_filter(vel, box_radii(sx, passes))
+    ry = box_radii(sy, passes)
+    if any(ry):
+        out = box_filter(np.ascontiguousarray(np.swapaxes(out, -1, -2)), ry)
+        out = np.swapaxes(out, -1, -2)
+    return out.astype(vel.dtype)
+
+
+class Smooth:
+    # smoothed starting model; smoothing the slowness keeps traveltimes closer to the original
+    def __init__(self, sigma=10., passes=3, slowness=False, name='smooth'):
+        self.sigma = sigma
+        self.passes = passes
+        self.slowness = slowness
+        self.name = name
+
+    def __call__(self, vel):
+        if self.slowness:
+            return (1. / gaussian_smooth(1. / vel, self.sigma, self.passes)).astype(vel.dtype)
+        return gaussian_smooth(vel, self.sigma, self.passes)
+
+
+class Slowness:
+    def __init__(self, name='slowness'):
+        self.name = name
+
+    def __call__(self, vel):
+        return (1. / vel).astype(vel.dtype)
+
+
+class GardnerDensity:
+    # rho = a * v**b; the defaults give g/cc for velocities in km/s
+    def __init__(self, a=1.741, b=0.25, name='density'):
+        self.a = a
+        self.b = b
+        self.name = name
+
+    def __call__(self, vel):
+        return (self.a * vel**self.b).astype(vel.dtype)
+
+
+def derive(vel, products, name='velocity'):
+    # dict of the velocity and every product, for one model or a batch
+    out = {name: vel}
+    for product in products:
+        out[product.name] = product(vel)
+    return out
+
+
+def to_records(products):
+    # one structured array with a field per product; a batch gives one record per model
+    names = list(products)
+    first = np.asarray(products[names[0]])
+    batched = first.ndim == 3
+    shape = first.shape[1:] if batched else first.shape
+    dtype = [(k, np.asarray(products[k]).dtype, shape) for k in names]
+    out = np.empty(len(first) if batched else (), dtype=dtype)
+    for k in names:
+        out[k] = products[k]
+    return out
@@ -0,0 +1,141 @@
+import os
+import json
+import importlib
+import functools
+import numpy as np
+from .model import Pipeline, errexit, seed_sequence, sample_seed
+from .plan import Plan
+
+
+def encode(val):
+    # json with tuples and arrays kept apart from lists, so factory arguments round-trip exactly
+    if isinstance(val, np.ndarray):
+        return {'__array__': val.tolist(), 'dtype': val.dtype.str}
+    if isinstance(val, np.generic):
+        return val.item()
+    if isinstance(val, tuple):
+        return {'__tuple__': [encode(v) for v in val]}
+    if isinstance(val, list):
+        return [encode(v) for v in val]
+    if isinstance(val, dict):
+        return {str(k): encode(v) for k,v in val.items()}
+    return val
+
+
+def decode(val):
+    if isinstance(val, dict):
+        if '__array__' in val:
+            return np.array(val['__array__'], dtype=val['dtype'])
+        if '__tuple__' in val:
+            return tuple(decode(v) for v in val['__tuple__'])
+        return {k: decode(v) for k,v in val.items()}
+    if isinstance(val, list):
+        return [decode(v) for v in val]
+    return val
+
+
+def factory_spec(factory):
+    # a Plan is stored as its spec, with the sample shape it was built for
+    if isinstance(factory, Plan):
+        return {'plan': dict(factory.spec, shape=list(factory.shape))}
+    args, kwargs = (), {}
+    if isinstance(factory, functools.partial):
+        args, kwargs = factory.args, factory.keywords
+        factory = factory.func
+    name = '%s:%s'%(factory.__module__, factory.__qualname__)
+    if '<' in name:
+        errexit("Factory must be importable to be stored in a recipe: %s"%name)
+    return {'name': name, 'args': encode(tuple(args)), 'kwargs': encode(dict(kwargs))}
+
+
+def load_factory(spec):
+    if 'plan' in spec:
+        return Plan(spec['plan'])
+    module, qualname = spec['name'].split(':')
+    func = importlib.import_module(module)
+    for attr in qualname.split('.'):
+        func = getattr(func, attr)
+    return functools.partial(func, *decode(spec['args']), **decode(spec['kwargs']))
+
+
+def seed_spec(seed):
+    return {'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key),
+            'pool_size': seed.pool_size, 'n_children_spawned': seed.n_children_spawned}
+
+
+def load_seed(spec):
+    seed = np.random.SeedSequence(spec['entropy'], spawn_key=tuple(spec['spawn_key']), pool_size=spec['pool_size'])
+    seed.spawn(spec['n_children_spawned'])
+    return seed
+
+
+def compact_history(history, max_size=64):
+    # keep the sampled parameters, drop per-column arrays (salt tops, water bottom, ...)
+    params = {}
+    for key, vals in history.items():
+        if all(np.size(v) <= max_size for v in vals):
+            params[key] = encode(list(vals))
+    return params
+
+
+def generate_recipe(factory, random_seed=None, max_size=64):
+    seed = seed_sequence(random_seed)
+    recipe = {'factory': factory_spec(factory), 'seed': seed_spec(seed)}
+    out = factory(random_seed=seed)
+    if isinstance(out, Pipeline):
+        pipe, out = out, out.generate()
+        recipe['steps'] = [type(step).__name__ for step in pipe.steps]
+        if pipe.model is not None:
+            recipe['params'] = compact_history(pipe.model.history, max_size)
+    return out, recipe
+
+
+def regenerate(recipe):
+    factory = load_factory(recipe['factory'])
+    out = factory(random_seed=load_seed(recipe['seed']))
+    if isinstance(out, Pipeline):
+        out = out.generate()
+    return out
+
+
+class RecipeDataset:
+    # one json recipe per line; samples are regenerated when indexed
+    def __init__(self, path):
+        self.path = path
+        self.recipes = []
+        if os.path.exists(path):
+            with open(path) as f:
+                lines = f.read().split('\n')
+            for line in lines:
+                try:
+                    self.recipes.append(json.loads(line))
+                except ValueError:
+                    break
+            if len(self.recipes) < len([line for line in lines if line]):
+                # drop a torn last line from an interrupted run
+                with open(path, 'w') as f:
+                    f.writelines(json.dumps(r)+'\n' for r in self.recipes)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def append(self, recipe):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(recipe)+'\n')
+        self.recipes.append(recipe)
+        return len(self.recipes) - 1
+
+    def recipe(self, i):
+        return self.recipes[i]
+
+    def __getitem__(self, i):
+        return regenerate(self.recipes[i])
+
+
+def generate_recipes(factory, dataset, n, random_seed=None):
+    # sample i uses the i-th child of SeedSequence(random_seed), as in generate_dataset
+    root = seed_sequence(random_seed)
+    for i in range(len(dataset), n):
+        _, recipe = generate_recipe(factory, sample_seed(root, i))
+        dataset.append(recipe)
+    return dataset
@@ -1,5 +1,8 @@
+import functools
 import numpy as np
-from .model import Random
+from .model import Random, mask_bits
+from .edits import ColumnFill
+from .fill import slice_bounds
 
 
 class GaussianSalt:
@@ -26,74 +29,144 @@ class GaussianSalt:
         d1 = 2 * sigma**2
         return A * np.exp(-(x-x0)**2/d1) - self.downshift * ny
 
-    def _add_salt_to_interface(self,interface,nx,ny):
+    def _add_salt_to_interface(self,interface,nx,ny,x0,height,width,penetrate_interface):
         interface_with_salt=interface.copy()
         ninterface = len(interface)
         neff_space = self.eff_space * ny
         iminspace = self.minspace * ny
 
-        x0     = self.x0     or self.random.uniform(*self.x0_range)*nx
-        height = self.height or self.random.uniform(*self.height_range)*ny
-        width  = self.width  or self.random.uniform(*self.width_range)*nx
-
         s = self._salt(height, width, x0, nx,ny)
         salt_top = ny - s
         self.salt_top = salt_top
 
-        if self.penetrate_interface is None:
-            penetrate_interface = self.random.choice([True,False])
-        else:
-            penetrate_interface = self.penetrate_interface
+        # all inner interfaces at once: those closer than neff_space to the salt top
+        # are pushed up by a wider, lower Gaussian of their own
+        i = np.arange(1, ninterface-1)
+        hmin = (salt_top - interface[1:-1]).min(axis=1)
+        near = hmin < neff_space
         if penetrate_interface:
-            for i in range(1,ninterface-1):
-                hdiff = salt_top[:] - interface[i,:]
-                if hdiff.min() < neff_space:
-                    height = abs(hdiff.min()) * (i/ninterface)
-                    scale = 1 + (ninterface - i)/ninterface
-                    swidth = width * scale
-                    si = self._salt(height,swidth,x0,nx,ny)
-                    interface_with_salt[i] -= si.astype(np.int32)
+            heights = np.abs(hmin) * (i/ninterface)
         else:
-            for i in range(1,ninterface-1):
-                hdiff = salt_top[:] - interface[i,:]
-                if hdiff.min() < neff_space:
-                    height = abs(hdiff.min()) + iminspace
-                    scale = 1 + (ninterface - i)/ninterface
-                    swidth = width * scale
-                    si = self._salt(height,swidth,x0,nx,ny)
-                    interface_with_salt[i] -= si.astype(np.int32)
+            heights = np.abs(hmin) + iminspace
+        scale = (1 + (ninterface - i)/ninterface).astype(np.result_type(width, 1.))
+        si = self._salt(heights[near,None], width*scale[near,None], x0, nx, ny)
+        interface_with_salt[1:-1][near] -= si.astype(np.int32)
+        if not penetrate_interface:
             interface_with_salt = self._adjust_interface(interface_with_salt,iminspace)
 
         return interface_with_salt
-        
+
     def _adjust_interface(self,interface,iminspace):
+        # from the bottom up, lift an interface that comes closer than iminspace to the
+        # one below; each lift shifts a whole row, so only the row minima are tracked
         ninterface = len(interface)
+        dmins = (interface[1:] - interface[:-1]).min(axis=1)
+        shift = np.zeros(ninterface, dtype=dmins.dtype)
         for i in reversed(range(1,ninterface)):
-            hdiff = interface[i]-interface[i-1]
-            dmin = hdiff.min()
+            dmin = dmins[i-1] - shift[i]
             if dmin < iminspace:
-                interface[i-1,:] = interface[i-1,:] - abs(dmin) - int(iminspace)
+                shift[i-1] = abs(dmin) + int(iminspace)
+        interface -= shift[:,None]
         return interface
 
-    def _add_salt_to_velocity(self,vel,salt_top,vsalt):
-        nx = len(salt_top)
-        for ix in range(nx):
-            vel[ix,int(salt_top[ix]):] = vsalt
-        return vel
+    def sample(self, model):
+        nx,ny = model.shape
+        x0     = self.x0     or self.random.uniform(*self.x0_range)*nx
+        height = self.height or self.random.uniform(*self.height_range)*ny
+        width  = self.width  or self.random.uniform(*self.width_range)*nx
+        if self.penetrate_interface is None:
+            penetrate_interface = self.random.choice([True,False])
+        else:
+            penetrate_interface = self.penetrate_interface
+        return dict(shape=model.shape, x0=x0, height=height, width=width, penetrate_interface=penetrate_interface)
 
-    def generate(self, model):
+    def apply(self, model, params):
         nx,ny = model.shape
+        sx, sy = model.scale(params)
+        x0, height, width = params['x0']*sx, params['height']*sy, params['width']*sx
         # add salt
-        model.set_interface(self._add_salt_to_interface(model.interface,nx,ny))
-        vel = model.generate(force_fill=True)
+        model.set_interface(self._add_salt_to_interface(model.interface,nx,ny,
+            x0,height,width,params['penetrate_interface']))
+        model.fill(force_fill=True)
         model.add_history('gaussian_salt_top',self.salt_top)
         model.add_history('gaussian_vsalt',self.vsalt)
-        salt_tops = model.history['gaussian_salt_top']
-        vsalts = model.history['gaussian_vsalt']
-        for salt_top,vsalt in zip(salt_tops, vsalts):
-            model.set_velocity(self._add_salt_to_velocity(vel,salt_top,vsalt))
+        model.add_history('gaussian_params',(x0,height,width))
+        # every salt fills its columns from its top down, later salts on top, so salts of the
+        # same velocity merge into one envelope row: the refill erased them, and only the
+        # envelope is drawn again
+        top = slice_bounds(self.salt_top.astype(np.int64), ny)
+        label = model.add_label('salt', self.vsalt)
+        envelope = model.salt_envelope
+        if envelope and envelope[-1][1] == self.vsalt:
+            envelope[-1] = (np.minimum(envelope[-1][0], top), self.vsalt, label)
+        else:
+            envelope.append((top, self.vsalt, label))
+        tops, vsalts, label_ids = zip(*envelope)
+        model.edit(ColumnFill('fill_below', tops, list(vsalts), list(label_ids), model.workspace, mask_bits['salt']))
         return model
 
+    def generate(self, model):
+        return self.apply(model, model.record(self, self.sample(model)))
+
+
+@functools.lru_cache(maxsize=16)
+def _coords(n):
+    coords = np.arange(n)
+    coords.flags.writeable = False
+    return coords
+
+
+def ellipse_box(nx, ny, x0, y0, a, b, angle=0.):
+    # grid window (ix0, ix1, iy0, iy1) around the ellipse, one cell of margin for rounding
+    t = np.deg2rad(angle)
+    hx = np.hypot(a*np.cos(t), b*np.sin(t))
+    hy = np.hypot(a*np.sin(t), b*np.cos(t))
+    ix0, ix1 = max(int(np.floor(x0-hx))-1, 0), min(int(np.ceil(x0+hx))+2, nx)
+    iy0, iy1 = max(int(np.floor(y0-hy))-1, 0), min(int(np.ceil(y0+hy))+2, ny)
+    return ix0, max(ix1, ix0), iy0, max(iy1, iy0)
+
+
+def ellipse_mask(x, y, x0, y0, a, b, angle=0.):
+    dx = x[:,None] - x0
+    dy = y[None,:] - y0
+    if angle:
+        t = np.deg2rad(angle)
+        dx, dy = dx*np.cos(t) + dy*np.sin(t), dy*np.cos(t) - dx*np.sin(t)
+    return (dx/a)**2 + (dy/b)**2 <= 1
+
+
+def paint_ellipses(vel, bodies, value, labels=None, label=None, offset=0, masks=None, mask_value=0):
+    # bodies: (x0, y0, a, b, angle) in cells and degrees; each is evaluated in its own window.
+    # vel may hold the columns offset.. of a larger grid, the bodies stay in grid coordinates.
+    width, ny = vel.shape
+    nx = offset + width
+    for x0, y0, a, b, angle in bodies:
+        ix0, ix1, iy0, iy1 = ellipse_box(nx, ny, x0, y0, a, b, angle)
+        ix0 = max(ix0, offset)
+        if ix1 <= ix0:
+            continue
+        mask = ellipse_mask(_coords(nx)[ix0:ix1], _coords(ny)[iy0:iy1], x0, y0, a, b, angle)
+        vel[ix0-offset:ix1-offset,iy0:iy1][mask] = value
+        if labels is not None:
+            labels[ix0-offset:ix1-offset,iy0:iy1][mask] = label
+        if masks is not None:
+            masks[ix0-offset:ix1-offset,iy0:iy1][mask] = mask_value
+    return vel
+
+
+class PaintEllipses:
+    # edit op for paint_ellipses
+    def __init__(self, bodies, value, label=None, offset=0):
+        self.bodies = bodies
+        self.value = value
+        self.label = label
+        self.offset = offset
+
+    def __call__(self, vel, labels, masks=None):
+        paint_ellipses(vel, self.bodies, self.value, labels, self.label, self.offset, masks, mask_bits['salt'])
+
+    def crop(self, x0, x1, ws=None):
+        return PaintEllipses(self.bodies, self.value, self.label, self.offset + x0)
 
 
 class EllipticSalt:
@@ -101,7 +174,7 @@ class EllipticSalt:
             x0_range=(0.1,0.9), y0_range=(0.4,0.9),
             width_range=(0.3,0.5), height_range=(0.08,0.2),
             vwidth_range=(0.1,0.2), vheight_range=(0.25,0.5),
-            vertical=None,
+            vertical=None, angle=None, angle_range=None, nbodies=1,
             random_seed=None, vround=4):
         self.random = Random(random_seed, vround)
         self.vsalt=vsalt
@@ -115,25 +188,31 @@ class EllipticSalt:
         self.va_range=np.array(vwidth_range)/2
         self.vb_range=np.array(vheight_range)/2
         self.vertical = vertical
+        # rotation in degrees, fixed or drawn from angle_range; no rotation by default
+        self.angle = angle
+        self.angle_range = angle_range
+        self.nbodies = nbodies
 
-    def mask(self,nx,ny,x0,y0,a,b):
-        ax = np.arange(nx)
-        ay = np.arange(ny)
-        yy,xx = np.meshgrid(ay,ax)
-        mask = ((xx-x0)/a)**2 + ((yy-y0)/b)**2 <= 1
-        return mask
+    def mask(self,nx,ny,x0,y0,a,b,angle=0.):
+        mask = np.zeros((nx,ny), dtype=bool)
+        return paint_ellipses(mask, [(x0,y0,a,b,angle)], True)
 
-    def generate(self, model):
+    def _center_on_salt(self, model):
+        salt_top = model.get_history('gaussian_salt_top')
+        return np.argmin(salt_top), np.min(salt_top)
+
+    def _sample_body(self, model, first):
         nx,ny=model.shape
         vertical = self.vertical
+        on_salt = False
 
         if self.center is not None:
             x0,y0 = self.center
         else:
-            if 'gaussian_salt_top' in model.history:
-                salt_top = model.get_history('gaussian_salt_top')
-                x0 = np.argmin(salt_top)
-                y0 = np.min(salt_top)
+            if first and 'gaussian_salt_top' in model.history:
+                # placed on top of the last Gaussian salt, found again at any resolution
+                x0,y0 = None,None
+                on_salt = True
                 vertical = False
             else:
                 x0 = self.random.uniform(*self.x0_range)*nx
@@ -147,16 +226,39 @@ class EllipticSalt:
             a_range, b_range = self.a_range, self.b_range
         a= self.a or self.random.uniform(*a_range)*nx
         b= self.b or self.random.uniform(*b_range)*ny
+        angle = self.angle or 0.
+        if self.angle is None and self.angle_range is not None:
+            angle = self.random.uniform(*self.angle_range)
+        return dict(x0=x0, y0=y0, a=a, b=b, angle=angle, on_salt=on_salt)
+
+    def sample(self, model):
+        bodies = [self._sample_body(model, i == 0) for i in range(self.nbodies)]
+        return dict(shape=model.shape, bodies=bodies)
+
+    def apply(self, model, params):
+        sx, sy = model.scale(params)
+        bodies = []
+        for body in params['bodies']:
+            if body['on_salt']:
+                x0,y0 = self._center_on_salt(model)
+            else:
+                x0,y0 = body['x0']*sx, body['y0']*sy
+            a,b = body['a']*sx, body['b']*sy
+
+            # salt does not penetrate the first interface
+            if y0 - b < model.interface[1].min():
+                y0 += model.interface[1].min()
+
+            bodies.append((x0,y0,a,b,body['angle']))
+            model.add_history('elliptic_center',(x0,y0))
+            model.add_history('elliptic_ab',(a,b))
+            model.add_history('elliptic_angle',body['angle'])
+            model.add_history('elliptic_vsalt',self.vsalt)
 
-        # salt does not penetrate the first interface
-        if y0 - b < model.interface[1].min():
-            y0 += model.interface[1].min()
-
-        mask = self.mask(nx,ny,x0,y0,a,b)
-        vel = model.generate()
-        vel[mask] = self.vsalt
-        model.set_velocity(vel)
-        model.add_history('elliptic_center',(x0,y0))
-        model.add_history('elliptic_ab',(a,b))
-        model.add_history('elliptic_vsalt',self.vsalt)
+        vsalt = self.vsalt
+        label = model.add_label('salt', vsalt)
+        model.edit(PaintEllipses(bodies, vsalt, label))
         return model
+
+    def generate(self, model):
+        return self.apply(model, model.record(self, self.sample(model)))
@@ -0,0 +1,34 @@
+import copy
+import numpy as np
+from .model import Model, errexit
+
+
+class Scene:
+    # the parameters a model was generated from, in the units of the grid they were
+    # sampled on; rasterize() replays them on any grid without touching a random generator
+    def __init__(self, model):
+        if not model.replayable:
+            errexit("Model was generated by steps that cannot be replayed")
+        self.shape = tuple(model.shape)
+        self.velseed = np.array(model.velseed)
+        self.veltype = model.veltype
+        self.max_pert = model.max_pert
+        self.vround = model.random.vround
+        # the steps are copied: apply() reads their settings, which plans redraw per sample
+        self.geometry = copy.deepcopy(model.geometry)
+        self.fill_draws = [np.array(v) for v in model.fill_draws]
+
+    def model(self, shape=None, labels=False, deferred=False, masks=False):
+        m = Model(tuple(shape or self.shape), self.velseed.copy(), self.max_pert,
+                  vround=self.vround, veltype=self.veltype, labels=labels, masks=masks)
+        m.deferred = deferred
+        m.replay_draws = list(self.fill_draws)
+        for step, params in self.geometry:
+            m = step.apply(m, params)
+        return m
+
+    def rasterize(self, shape=None, deferred=False):
+        return self.model(shape, deferred=deferred).generate()
+
+    def rasterize_many(self, shapes):
+        return [self.rasterize(shape) for shape in shapes]
@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import argparse
+import numpy as np
+from .model import Pipeline, errexit, seed_sequence, seed_json, sample_seed
+from .store import DatasetStore, jsonable, write_json, read_json
+from .recipe import factory_spec, load_factory
+from .plan import Plan, load_plan, gom_spec
+
+
+# A job directory on a shared filesystem holds a DatasetStore (manifest.json, shard_%05d.npy
+# and .json) and a work/ directory with the job description and the claims. Workers claim a
+# shard by creating work/shard_%05d.<k>.claim with O_EXCL and keep its mtime fresh while they
+# generate it; a claim that has not been touched for `stale` seconds is taken over by creating
+# claim k+1, so two workers never both take over the same stale claim. Sample i always uses
+# the i-th child of the job seed, and shards are written to a temporary file and renamed, so
+# a shard generated twice (a slow worker taken for dead) gives the same file.
+
+def job_factory(factory):
+    # json description of the factory, for every node to build the same one
+    if factory is None:
+        factory = Plan(gom_spec)
+    if isinstance(factory, dict):
+        return factory
+    return factory_spec(factory)
+
+
+class ShardedJob:
+    def __init__(self, path, n=None, factory=None, shard_size=1024, random_seed=None, stale=600.):
+        self.path = path
+        self.work = os.path.join(path, 'work')
+        self.stale = stale
+        self.token = '%s-%d-%s'%(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        os.makedirs(self.work, exist_ok=True)
+        job_path = os.path.join(self.work, 'job.json')
+        if n is not None:
+            job = {'n': int(n), 'shard_size': int(shard_size), 'factory': job_factory(factory),
+                   'random_seed': np.random.SeedSequence().entropy if random_seed is None else random_seed}
+            if isinstance(random_seed, np.random.SeedSequence):
+                job['random_seed'] = seed_json(random_seed)
+            # the first worker creates the job (os.link does not replace an existing file),
+            # the others must ask for the same one; without a seed they take the job's
+            tmp = os.path.join(self.work, 'job.json.%s'%self.token)
+            write_json(tmp, job, tmp + '.tmp')
+            try:
+                os.link(tmp, job_path)
+            except FileExistsError:
+                pass
+            os.remove(tmp)
+            existing = read_json(job_path)
+            if random_seed is None:
+                job['random_seed'] = existing['random_seed']
+            if json.loads(json.dumps(jsonable(job))) != existing:
+                errexit("%s holds a different job"%path)
+        elif not os.path.exists(job_path):
+            errexit("No job in %s"%path)
+        self.job = read_json(job_path)
+        self.n = self.job['n']
+        self.shard_size = self.job['shard_size']
+        self.nshards = -(-self.n // self.shard_size)
+        self.root = seed_sequence(self.job['random_seed'])
+        self.factory = load_factory(self.job['factory'])
+        self.clock = os.path.join(self.work, 'worker.%s'%self.token)
+
+    def now(self):
+        # the filesystem's clock, so that nodes with skewed clocks agree on staleness
+        with open(self.clock, 'a'):
+            os.utime(self.clock)
+        return os.stat(self.clock).st_mtime
+
+    def done_path(self, ishard):
+        return os.path.join(self.work, 'shard_%05d.done'%ishard)
+
+    def claim_path(self, ishard, k):
+        return os.path.join(self.work, 'shard_%05d.%d.claim'%(ishard, k))
+
+    def status(self):
+        # per shard: 'done', or the latest claim number and its mtime, or None if unclaimed
+        state = [None] * self.nshards
+        names = os.listdir(self.work)
+        for name in names:
+            parts = name.split('.')
+            if not name.startswith('shard_') or parts[-1] != 'claim':
+                continue
+            i, k = int(parts[0][6:]), int(parts[1])
+            if i < self.nshards and (state[i] is None or k > state[i][0]):
+                state[i] = (k, name)
+        for name in names:
+            if name.startswith('shard_') and name.endswith('.done'):
+                i = int(name[6:11])
+                if i < self.nshards:
+                    state[i] = 'done'
+        for i, s in enumerate(state):
+            if s is not None and s != 'done':
+                try:
+                    state[i] = (s[0], os.stat(os.path.join(self.work, s[1])).st_mtime)
+                except FileNotFoundError:
+                    # released by a worker that just finished
+                    state[i] = 'done' if os.path.exists(self.done_path(i)) else None
+        return state
+
+    def claim(self, ishard, k):
+        try:
+            fd = os.open(self.claim_path(ishard, k), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'worker': self.token, 'shard': ishard, 'claim': k}, f)
+        return self.claim_path(ishard, k)
+
+    def next_shard(self):
+        # an unclaimed shard, else one whose claim went stale; None if none is free now
+        state = self.status()
+        now = self.now()
+        for i, s in enumerate(state):
+            if s is None:
+                path = self.claim(i, 0)
+                if path:
+                    return i, path
+        for i, s in enumerate(state):
+            if s is not None and s != 'done' and now - s[1] > self.stale:
+                path = self.claim(i, s[0]+1)
+                if path:
+                    return i, path
+        return None
+
+    def generate_shard(self, ishard, claim):
+        start = ishard * self.shard_size
+        stop = min(start + self.shard_size, self.n)
+        final = os.path.join(self.path, 'shard_%05d.npy'%ishard)
+        tmp = '%s.%s.tmp'%(final, self.token)
+        t0 = time.time()
+        beat = t0
+        arr, histories = None, []
+        for i in range(start, stop):
+            out = self.factory(random_seed=sample_seed(self.root, i))
+            history = {}
+            if isinstance(out, Pipeline):
+                pipe, out = out, out.generate()
+                history = pipe.model.history if pipe.model is not None else {}
+            if arr is None:
+                arr = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32,
+                                                shape=(self.shard_size,)+out.shape)
+            arr[i-start] = out
+            histories.append(jsonable(dict(history)))
+            if time.time() - beat > self.stale / 10:
+                os.utime(claim)
+                beat = time.time()
+        shape = list(arr.shape[1:])
+        arr.flush()
+        del arr
+        os.replace(tmp, final)
+        hist = os.path.join(self.path, 'shard_%05d.json'%ishard)
+        write_json(hist, histories, '%s.%s.tmp'%(hist, self.token))
+        meta = {'shard': ishard, 'start': start, 'stop': stop, 'shape': shape,
+                'worker': self.token, 'claim': int(claim.split('.')[-2]), 'seconds': time.time() - t0}
+        write_json(self.done_path(ishard), meta, '%s.%s.tmp'%(self.done_path(ishard), self.token))
+        os.remove(claim)
+        return meta
+
+    def run(self, max_shards=None, wait=True, poll=5.):
+        # claims and generates shards until none is left (or max_shards were done here);
+        # with wait, also waits for the shards other workers hold, to take them over if their
+        # workers die. The job is merged by whichever worker sees it complete.
+        ndone = 0
+        try:
+            while max_shards is None or ndone < max_shards:
+                shard = self.next_shard()
+                if shard is not None:
+                    self.generate_shard(*shard)
+                    ndone += 1
+                    continue
+                if all(s == 'done' for s in self.status()):
+                    self.merge()
+                    break
+                if not wait:
+                    break
+                time.sleep(poll)
+        finally:
+            if os.path.exists(self.clock):
+                os.remove(self.clock)
+        return ndone
+
+    def merge(self):
+        # one worker writes the store manifest and work/summary.json from the per-shard records
+        manifest = os.path.join(self.path, DatasetStore.manifest_name)
+        if os.path.exists(manifest) and read_json(manifest)['count'] == self.n:
+            return self.summary()
+        merge_claim = os.path.join(self.work, 'merge.claim')
+        try:
+            if self.now() - os.stat(merge_claim).st_mtime > self.stale:
+                # the merging worker died: move its claim away, only one worker succeeds
+                os.rename(merge_claim, '%s.%s.stale'%(merge_claim, self.token))
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(merge_claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return None
+        try:
+            shards = [read_json(self.done_path(i)) for i in range(self.nshards)]
+            shapes = set(tuple(s['shape']) for s in shards)
+            if len(shapes) != 1:
+                errexit("Shards have different sample shapes: %s"%sorted(shapes))
+            workers = sorted(set(s['worker'] for s in shards))
+            summary = {'n': self.n, 'nshards': self.nshards, 'workers': workers,
+                       'seconds': sum(s['seconds'] for s in shards), 'shards': shards}
+            write_json(os.path.join(self.work, 'summary.json'), summary)
+            store = DatasetStore(self.path, shapes.pop(), self.shard_size)
+            store.count = self.n
+            store.attrs.update(random_seed=self.job['random_seed'], factory=self.job['factory'])
+            store.flush()
+        finally:
+            os.remove(merge_claim)
+        return summary
+
+    def summary(self):
+        return read_json(os.path.join(self.work, 'summary.json'))
+
+
+def generate_sharded(path, n, factory=None, shard_size=1024, random_seed=None, stale=600.,
+                     max_shards=None, wait=True, poll=5.):
+    # one worker of a job; run the same call on every node, the result is a DatasetStore
+    job = ShardedJob(path, n, factory, shard_size, random_seed, stale)
+    job.run(max_shards, wait, poll)
+    return job
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate velocity models as one worker of a sharded job')
+    parser.add_argument('path', help='job and dataset directory on a filesystem shared by the workers')
+    parser.add_argument('-n', type=int, required=True, help='number of samples')
+    parser.add_argument('--seed', type=int, help='job seed; drawn by the first worker if not given')
+    parser.add_argument('--shard-size', type=int, default=1024)
+    parser.add_argument('--plan', help='generator plan (.json or .yaml); the GOM mixture by default')
+    parser.add_argument('--factory', help='importable factory module:function, called with random_seed')
+    parser.add_argument('--kwargs', default='{}', help='factory keyword arguments as json')
+    parser.add_argument('--shape', type=int, nargs=2, help='sample shape for --plan or the default plan')
+    parser.add_argument('--stale', type=float, default=600., help='seconds after which a claim is taken over')
+    parser.add_argument('--poll', type=float, default=5., help='seconds between checks while waiting')
+    parser.add_argument('--max-shards', type=int, help='generate at most this many shards here')
+    parser.add_argument('--no-wait', action='store_true', help='exit when no shard is free to claim')
+    args = parser.parse_args(argv)
+
+    if args.factory:
+        factory = {'name': args.factory, 'args': [], 'kwargs': json.loads(args.kwargs)}
+    elif args.plan:
+        factory = load_plan(args.plan, shape=args.shape)
+    else:
+        factory = Plan(gom_spec, shape=args.shape)
+    job = generate_sharded(args.path, args.n, factory, args.shard_size, args.seed, args.stale,
+                           args.max_shards, not args.no_wait, args.poll)
+    state = job.status()
+    print('%s: %d of %d shards done'%(args.path, sum(s == 'done' for s in state), job.nshards))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
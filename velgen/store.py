@@ -0,0 +1,170 @@
+import os
+import json
+import numpy as np
+from .model import errexit
+
+
+def jsonable(val):
+    if isinstance(val, np.ndarray):
+        return val.tolist()
+    if isinstance(val, np.generic):
+        return val.item()
+    if isinstance(val, dict):
+        return {str(k): jsonable(v) for k,v in val.items()}
+    if isinstance(val, (list, tuple)):
+        return [jsonable(v) for v in val]
+    return val
+
+
+def write_json(path, obj, tmp=None):
+    # write to a temporary file and rename, so a crash never leaves a torn file; writers
+    # that may race on the same path pass their own tmp name
+    tmp = tmp or path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class DatasetStore:
+    manifest_name = 'manifest.json'
+
+    def __init__(self, path, shape=None, shard_size=1024, dtype=np.float32, flush_every=64):
+        self.path = path
+        self.flush_every = flush_every
+        self._shard = None
+        self._shard_index = None
+        self._readers = {}
+        self._pending = 0
+        manifest = os.path.join(path, self.manifest_name)
+        if os.path.exists(manifest):
+            meta = read_json(manifest)
+            self.shape = tuple(meta['shape'])
+            self.dtype = np.dtype(meta['dtype'])
+            self.shard_size = meta['shard_size']
+            self.count = meta['count']
+            self.attrs = meta.get('attrs', {})
+            if shape is not None and tuple(shape) != self.shape:
+                errexit("Wrong sample shape: expected %s, got %s"%(self.shape, tuple(shape)))
+        else:
+            if shape is None:
+                errexit("A sample shape is required to create a dataset")
+            os.makedirs(path, exist_ok=True)
+            self.shape = tuple(shape)
+            self.dtype = np.dtype(dtype)
+            self.shard_size = shard_size
+            self.count = 0
+            self.attrs = {}
+            self._write_manifest()
+        self._history = {}
+
+    def __len__(self):
+        return self.count
+
+    def shard_path(self, ishard, ext='.npy'):
+        return os.path.join(self.path, 'shard_%05d%s'%(ishard, ext))
+
+    def _write_manifest(self):
+        meta = {
+            'shape': list(self.shape),
+            'dtype': self.dtype.str,
+            'shard_size': self.shard_size,
+            'count': self.count,
+            'nshards': -(-self.count // self.shard_size),
+            'attrs': jsonable(self.attrs),
+        }
+        write_json(os.path.join(self.path, self.manifest_name), meta)
+
+    def _open_shard(self, ishard):
+        fname = self.shard_path(ishard)
+        if os.path.exists(fname):
+            shard = np.load(fname, mmap_mode='r+')
+        else:
+            shard = np.lib.format.open_memmap(fname, mode='w+', dtype=self.dtype,
+                    shape=(self.shard_size,)+self.shape)
+        hname = self.shard_path(ishard, '.json')
+        nvalid = min(max(self.count - ishard*self.shard_size, 0), self.shard_size)
+        history = read_json(hname)[:nvalid] if os.path.exists(hname) else []
+        # samples written after the last manifest update are discarded
+        history += [{}] * (nvalid - len(history))
+        self._readers.pop(ishard, None)
+        self._shard, self._shard_index = shard, ishard
+        self._history[ishard] = history
+
+    def append(self, vel, history=None):
+        vel = np.asarray(vel)
+        if vel.shape != self.shape:
+            errexit("Wrong sample shape: expected %s, got %s"%(self.shape, vel.shape))
+        ishard, islot = divmod(self.count, self.shard_size)
+        if self._shard_index != ishard:
+            self._flush_shard()
+            self._open_shard(ishard)
+        self._shard[islot] = vel
+        self._history[ishard].append(jsonable(dict(history or {})))
+        self.count += 1
+        self._pending += 1
+        if islot == self.shard_size-1 or self._pending >= self.flush_every:
+            self.flush()
+        return self.count - 1
+
+    def extend(self, vels, histories=None):
+        histories = histories or [None] * len(vels)
+        for vel, history in zip(vels, histories):
+            self.append(vel, history)
+
+    def _flush_shard(self):
+        if self._shard is None:
+            return
+        self._shard.flush()
+        write_json(self.shard_path(self._shard_index, '.json'), self._history[self._shard_index])
+
+    def flush(self):
+        # data and per-sample history first, then the manifest that commits them
+        self._flush_shard()
+        self._write_manifest()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        self._shard = None
+        self._shard_index = None
+        self._readers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _reader(self, ishard):
+        if ishard == self._shard_index:
+            return self._shard
+        if ishard not in self._readers:
+            self._readers[ishard] = np.load(self.shard_path(ishard), mmap_mode='r')
+        return self._readers[ishard]
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("sample index %d out of range"%i)
+        ishard, islot = divmod(i, self.shard_size)
+        return self._reader(ishard)[islot]
+
+    def history(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("sample index %d out of range"%i)
+        ishard, islot = divmod(i, self.shard_size)
+        if ishard not in self._history:
+            hname = self.shard_path(ishard, '.json')
+            self._history[ishard] = read_json(hname) if os.path.exists(hname) else []
+        history = self._history[ishard]
+        return history[islot] if islot < len(history) else {}
@@ -0,0 +1,80 @@
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from .model import errexit
+from .fill import velocity_functions
+from .kernels import kernel
+from .deform import warp, reach
+from .workspace import Workspace
+
+
+def open_output(path, shape, dtype):
+    # a .npy memmap at path, or an array in memory
+    if path is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+
+def render_window(model, edits, x0, x1, ws, labels_dtype=None, masks=False):
+    # replays the edits on the columns x0:x1 only; the geometry stays in grid coordinates
+    nx, ny = model.shape
+    vel = ws.zeros('tile', (x1-x0, ny))
+    labels = None if labels_dtype is None else ws.zeros('tile_labels', (x1-x0, ny), labels_dtype)
+    masks = ws.zeros('tile_masks', (x1-x0, ny), np.uint8) if masks else None
+    func = velocity_functions[model.veltype]
+    for e in edits:
+        if e[0] == 'fill':
+            kernel('fill_layers')(vel, e[2][:,x0:x1], e[1], func, labels, ws=ws, masks=masks)
+        elif e[0] == 'set':
+            vel[...] = e[1][x0:x1]
+        elif e[0] == 'warp':
+            warp(vel, labels, e[1], ws, x0, nx, masks)
+        else:
+            if not hasattr(e[1], 'crop'):
+                errexit("Edit %r cannot be rendered in tiles"%(e[1],))
+            e[1].crop(x0, x1, ws)(vel, labels, masks)
+    return vel, labels, masks
+
+
+def render_tiles(model, out=None, tile=1024, workers=1, labels=None, masks=None):
+    # renders the fills and edits a deferred model recorded into out, tile columns at a time.
+    # Tiles overlap by the reach of the faults, so they match a full render exactly, and
+    # only the tiles and the per-column geometry are held in memory.
+    if not model.deferred:
+        errexit("Tiled rendering needs a deferred model")
+    if model.veltype not in ('constant', 'linear', 'vlinear'):
+        errexit("Velocity type %s cannot be rendered in tiles"%model.veltype)
+    nx, ny = model.shape
+    if out is None:
+        out = np.empty((nx, ny), dtype=np.float32)
+    if labels is not None and model.labels_dtype is None:
+        errexit("The model does not track labels")
+    if masks is not None and model.masks_dtype is None:
+        errexit("The model does not track masks")
+    edits = model.replay_edits()
+    halo = reach([f for e in edits if e[0] == 'warp' for f in e[1]])
+    local = threading.local()
+
+    def render(x0):
+        if not hasattr(local, 'ws'):
+            local.ws = Workspace()
+        x1 = min(x0+tile, nx)
+        a, b = max(x0-halo, 0), min(x1+halo, nx)
+        vel, lab, mask = render_window(model, edits, a, b, local.ws,
+                                       None if labels is None else labels.dtype, masks is not None)
+        out[x0:x1] = vel[x0-a:x1-a]
+        if labels is not None:
+            labels[x0:x1] = lab[x0-a:x1-a]
+        if masks is not None:
+            masks[x0:x1] = mask[x0-a:x1-a]
+
+    starts = range(0, nx, tile)
+    if workers <= 1:
+        for x0 in starts:
+            render(x0)
+    else:
+        # numpy and numba release the GIL in the kernels, tiles write disjoint columns
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render, starts))
+    model.edits = []
+    return out
@@ -1,58 +1,58 @@
 import numpy as np
-from .model import Random, Model, Pipeline, Identity
+from .model import Random, Model, Pipeline, Identity, seed_sequence, sample_seed
 from .layer import FlatLayer, DippingLayer, LinearWaterLayer
 from .fold import CosineFold
 from .fault import LinearFault
 from .salt import GaussianSalt, EllipticSalt
 
 
-def flat_generator(shape, velseed):
+def flat_generator(shape, velseed, random_seed=None):
     model = Model(shape, velseed)
     pipe = Pipeline([
         FlatLayer()
         ], model)
-    return pipe
+    return pipe.seed(random_seed)
 
-def dip_generator(shape, velseed):
+def dip_generator(shape, velseed, random_seed=None):
     model = Model(shape, velseed)
     pipe = Pipeline([
         DippingLayer()
         ], model)
-    return pipe
+    return pipe.seed(random_seed)
 
-def cosine_fold_generator(shape, velseed):
+def cosine_fold_generator(shape, velseed, random_seed=None):
     model = Model(shape, velseed)
     pipe = Pipeline([
         FlatLayer(),
         CosineFold()
         ], model)
-    return pipe
+    return pipe.seed(random_seed)
 
-def linear_fault_generator(shape, velseed, max_nfaults=2):
+def linear_fault_generator(shape, velseed, max_nfaults=2, random_seed=None):
     model = Model(shape, velseed)
     pipe = Pipeline([
         FlatLayer(),
         CosineFold(),
         LinearFault(max_nfaults=max_nfaults)
         ], model)
-    return pipe
+    return pipe.seed(random_seed)
 
-def gaussian_salt_generator(shape, velseed, vsalt=4.5):
+def gaussian_salt_generator(shape, velseed, vsalt=4.5, random_seed=None):
     model = Model(shape, velseed)
     pipe = Pipeline([
         FlatLayer(),
         CosineFold(),
         GaussianSalt(vsalt=vsalt)
         ], model)
-    return pipe
+    return pipe.seed(random_seed)
 
-def elliptic_salt_generator(shape, velseed, vsalt=4.5, nsalts=2):
+def elliptic_salt_generator(shape, velseed, vsalt=4.5, nsalts=2, random_seed=None):
     model = Model(shape, velseed)
     steps = [FlatLayer(), CosineFold()] + [EllipticSalt(vsalt=vsalt)] * nsalts
     pipe = Pipeline(steps, model)
-    return pipe
+    return pipe.seed(random_seed)
 
-def gaussian_elliptic_salt_generator(shape, velseed, vsalt=4.5):
+def gaussian_elliptic_salt_generator(shape, velseed, vsalt=4.5, random_seed=None):
     model = Model(shape, velseed)
     pipe = Pipeline([
         FlatLayer(),
@@ -60,17 +60,19 @@ def gaussian_elliptic_salt_generator(shape, velseed, vsalt=4.5):
         GaussianSalt(vsalt=vsalt),
         EllipticSalt(vsalt=vsalt)
         ], model)
-    return pipe
+    return pipe.seed(random_seed)
 
 
-def choice(container):
-    random = Random()
+def choice(container, random=None):
+    random = random or Random()
     i = random.choice(np.arange(len(container),dtype=np.int32))
     return container[i]
 
 
-def gom_generator(shape, dz, velseed=None, vsalt=4.5, v0=1.5, vwater=1.5, nlayers=None, k=None, max_nfaults=3, generate=False):
-    random = Random()
+def gom_generator(shape, dz, velseed=None, vsalt=4.5, v0=1.5, vwater=1.5, nlayers=None, k=None, max_nfaults=3, generate=False, random_seed=None):
+    root = seed_sequence(random_seed)
+    scenario_seed, pipe_seed = sample_seed(root, 0), sample_seed(root, 1)
+    random = Random(scenario_seed)
     zmax = shape[1]*dz
     if velseed is None:
         # GOM k=0.4
@@ -86,13 +88,13 @@ def gom_generator(shape, dz, velseed=None, vsalt=4.5, v0=1.5, vwater=1.5, nlayer
     layer1 = [FlatLayer(y_range=(0.1,0.9), minsplit=0.01)]
     layer2 = [DippingLayer(y_range=(0.1,0.9), minsplit=0.01)]
     layers = [layer1, layer2]
-    layer = choice(layers)
+    layer = choice(layers, random)
 
     # fold
     fold0 = [Identity()]
     fold1 = [CosineFold()]
     folds = [fold0, fold1]
-    fold = choice(folds)
+    fold = choice(folds, random)
 
     # salt type
     no_salt = [Identity()]
@@ -103,12 +105,12 @@ def gom_generator(shape, dz, velseed=None, vsalt=4.5, v0=1.5, vwater=1.5, nlayer
     salt4 = salt3 * 2
     salt5 = salt1 + salt3
     salts = [no_salt, fault, salt1, salt2, salt3, salt4, salt5]
-    salt = choice(salts)
+    salt = choice(salts, random)
 
     waterlayer = [LinearWaterLayer(vwater=vwater, y_range=(0.1,0.2))]
 
     steps = layer + fold + salt + waterlayer
-    pipe = Pipeline(steps, model)
+    pipe = Pipeline(steps, model).seed(pipe_seed)
     if generate:
         return pipe.generate()
     else:
@@ -0,0 +1,36 @@
+import numpy as np
+
+
+class Workspace:
+    # named buffers reused from sample to sample; one per (name, shape, dtype)
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.float32):
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        buf = self.buffers.get(key)
+        if buf is None:
+            buf = np.empty(shape, dtype=dtype)
+            self.buffers[key] = buf
+            self.allocations += 1
+        return buf
+
+    def zeros(self, name, shape, dtype=np.float32):
+        buf = self.get(name, shape, dtype)
+        buf[...] = 0
+        return buf
+
+    @property
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self.buffers.values())
+
+    def clear(self):
+        self.buffers = {}
+
+
+def scratch(ws, name, shape, dtype=np.float32):
+    # a workspace buffer, or a fresh array without one
+    if ws is None:
+        return np.empty(shape, dtype=dtype)
+    return ws.get(name, shape, dtype)